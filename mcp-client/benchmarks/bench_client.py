@@ -0,0 +1,109 @@
+#End-to-end benchmark of MCPClient queries (LLM call -> tool call -> LLM call) with no network at all
+#Usage: python benchmarks/bench_client.py [--queries 50] [--concurrency 5] [--ttft 0.3] [--output results.json]
+##--conversation runs the queries one after another as follow-ups in one conversation (history + tool result reuse),
+##compare llm_input_tokens / upstream_requests with and without it, or with different MCP_CONTEXT_TOKENS budgets
+##the LLM is benchmarks/stub_llm.py (via ANTHROPIC_BASE_URL), the weather server is the real ../weather/weather.py
+##talking to ../weather/benchmarks/stub_nws.py serving its fixtures
+##reports total and first-chunk latency percentiles, throughput and peak RSS as JSON, --baseline flags regressions
+
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEATHER_DIR = os.path.join(os.path.dirname(os.path.dirname(HERE)), "weather")
+sys.path.insert(0, os.path.dirname(HERE)) #client.py, server_manager.py
+sys.path.insert(0, os.path.join(WEATHER_DIR, "benchmarks")) #stub_nws.py, bench_results.py
+
+from bench_results import check_baseline, latency_summary, max_rss_mb, write_results
+from stub_llm import StubLLMServer
+from stub_nws import StubNWSServer
+
+QUESTIONS = [
+    "What's the forecast at 39.7456, -97.0892?",
+    "Are there any weather alerts in KS right now?",
+    "What's the forecast at 39.8456, -96.9892?",
+    "Any alerts for MO?",
+]
+
+async def run_query(client, query: str, conversation=None) -> tuple[float, float, bool]:
+    """(total ms, ms until the first streamed chunk, ok) for one query."""
+    start = time.perf_counter()
+    first_chunk = None
+    try:
+        async for _ in client.stream_query(query, conversation):
+            if first_chunk is None:
+                first_chunk = time.perf_counter()
+        ok = True
+    except Exception:
+        ok = False
+    end = time.perf_counter()
+    return (end - start) * 1000, ((first_chunk or end) - start) * 1000, ok
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of MCPClient")
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4, help="queries in flight at once")
+    parser.add_argument("--conversation", action="store_true", help="run the queries in order as one multi-turn conversation (ignores --concurrency)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="stub LLM seconds before each reply starts")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="stub LLM seconds between streamed words")
+    parser.add_argument("--nws-latency", type=float, default=0.05, help="stub NWS seconds per request")
+    parser.add_argument("--output", help="also write the JSON results here")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    nws = StubNWSServer(max_age=60, fixtures=True, latency=args.nws_latency).start()
+    llm = StubLLMServer(ttft=args.ttft, token_delay=args.token_delay).start()
+    #set before client.py is imported/constructed: the SDK and the weather.py subprocess both read these from the environment
+    os.environ.update(ANTHROPIC_BASE_URL=llm.base_url, ANTHROPIC_API_KEY="stub-key", NWS_API_BASE=nws.base_url, NWS_GRID_INDEX_PATH="")
+
+    with contextlib.redirect_stdout(sys.stderr): #client.py prints progress messages, keep stdout for the JSON results
+        from client import MCPClient
+        client = MCPClient()
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            await client.connect_to_server(os.path.join(WEATHER_DIR, "weather.py"))
+        queries = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.queries)]
+        semaphore = asyncio.Semaphore(1 if args.conversation else args.concurrency)
+        conversation = client.conversation if args.conversation else None
+
+        async def limited(query: str):
+            async with semaphore:
+                return await run_query(client, query, conversation)
+
+        start = time.perf_counter()
+        timed = await asyncio.gather(*(limited(query) for query in queries))
+        elapsed = time.perf_counter() - start
+    finally:
+        await client.cleanup()
+        nws.stop()
+        llm.stop()
+
+    failures = sum(1 for _, _, ok in timed if not ok)
+    results = {
+        "benchmark": "bench_client",
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "tolerance")},
+        "calls": len(timed),
+        "errors": failures,
+        "error_rate": round(failures / len(timed), 4) if timed else 0.0,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(timed) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary([total for total, _, _ in timed]),
+        "first_chunk_ms": latency_summary([first for _, first, _ in timed]),
+        "llm_requests": llm.request_count,
+        "llm_input_tokens": llm.input_tokens,
+        "tool_results_reused": client.tool_results.hits,
+        "history_compactions": client.conversation.compactions,
+        "upstream_requests": nws.request_count,
+        "server_max_rss_mb": max_rss_mb(children=True),
+        "client_max_rss_mb": max_rss_mb(), #includes the two stub servers' threads, they run in this process
+    }
+    write_results(results, args.output)
+    return check_baseline(results, args.baseline, args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,174 @@
+#Tiny local stand-in for Anthropic's Messages API, so the client can be benchmarked without network, keys or token costs
+#Point the anthropic SDK at it with ANTHROPIC_BASE_URL=http://127.0.0.1:<port> (any ANTHROPIC_API_KEY works)
+#Behaves like a model that always uses one tool and then answers:
+##a user question -> one tool_use block (get_alerts if the question mentions alerts, otherwise get_forecast, with the
+##state / coordinates picked out of the question), after the tool_result comes back -> a short text answer quoting it
+##supports stream=true (the same server-sent events the real api sends) and plain JSON replies
+##ttft is slept before the first event, token_delay between streamed text pieces, so streaming shows up in the numbers
+##usage is estimated at ~4 characters per token, and the tools/system prefix is reported as cache_creation the first time
+##and cache_read after that, like prompt caching does
+#Run it on its own with: python benchmarks/stub_llm.py --port 8082 --ttft 0.3
+
+import argparse
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_COORDINATES = (39.7456, -97.0892) #same point as stub_nws.py's fixtures
+DEFAULT_STATE = "KS"
+
+def estimate_tokens(value) -> int:
+    return max(1, len(json.dumps(value)) // 4)
+
+def pick_tool_call(question: str, tools: list[dict]) -> tuple[str, dict] | None:
+    """Which tool the stub "model" calls for a question, None if it has no suitable tool."""
+    names = [tool["name"] for tool in tools]
+    if "alert" in question.lower():
+        name = next((name for name in names if name.endswith("get_alerts")), None)
+        state = re.search(r"\b([A-Z]{2})\b", question)
+        arguments = {"state": state.group(1) if state else DEFAULT_STATE}
+    else:
+        name = next((name for name in names if name.endswith("get_forecast")), None)
+        numbers = [float(n) for n in re.findall(r"-?\d+\.\d+", question)]
+        latitude, longitude = numbers[:2] if len(numbers) >= 2 else DEFAULT_COORDINATES
+        arguments = {"latitude": latitude, "longitude": longitude}
+    return (name, arguments) if name else None
+
+def tool_result_text(block: dict) -> str:
+    content = block.get("content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content if part.get("type") == "text")
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" #keep-alive, the SDK reuses its connections like it does with the real api
+    disable_nagle_algorithm = True #streamed events are tiny writes, don't let them sit in the send buffer
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/messages":
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with self.server.lock:
+            self.server.request_count += 1
+            message_id = f"msg_stub_{next(self.server.ids)}"
+        content, stop_reason = self.server.reply_for(request, message_id)
+        usage = self.server.usage_for(request, content)
+        message = {"id": message_id, "type": "message", "role": "assistant", "model": request.get("model", "stub"),
+                   "content": content, "stop_reason": stop_reason, "stop_sequence": None, "usage": usage}
+        time.sleep(self.server.ttft)
+        if request.get("stream"):
+            self.stream_message(message)
+        else:
+            payload = json.dumps(message).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def stream_message(self, message: dict) -> None:
+        #same event sequence as https://docs.anthropic.com/en/docs/build-with-claude/streaming
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        start = dict(message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=1))
+        self.send_event("message_start", {"type": "message_start", "message": start})
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                self.send_event("content_block_start", {"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}})
+                for piece in re.findall(r"\S+\s*", block["text"]): #roughly one token per word
+                    time.sleep(self.server.token_delay)
+                    self.send_event("content_block_delta", {"type": "content_block_delta", "index": index, "delta": {"type": "text_delta", "text": piece}})
+            else:
+                self.send_event("content_block_start", {"type": "content_block_start", "index": index, "content_block": dict(block, input={})})
+                self.send_event("content_block_delta", {"type": "content_block_delta", "index": index,
+                                                        "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}})
+            self.send_event("content_block_stop", {"type": "content_block_stop", "index": index})
+        self.send_event("message_delta", {"type": "message_delta", "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                          "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+        self.send_event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n") #end of the chunked body, the connection stays open for the next request
+
+    def send_event(self, name: str, data: dict) -> None:
+        chunk = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args): #keeps benchmark output clean
+        pass
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ttft: float = 0.0, token_delay: float = 0.0):
+        super().__init__((host, port), StubLLMHandler)
+        self.ttft = ttft #seconds before the first byte of every reply
+        self.token_delay = token_delay #seconds between streamed text pieces
+        self.base_url = f"http://{host}:{self.server_address[1]}"
+        self.request_count = 0
+        self.input_tokens = 0 #estimated message tokens received over all requests, shows what history compaction saves
+        self.ids = itertools.count(1)
+        self.cached_prefixes: set[str] = set() #tools+system prefixes already "written" to the prompt cache
+        self.lock = threading.Lock()
+
+    def reply_for(self, request: dict, message_id: str) -> tuple[list[dict], str]:
+        messages = request.get("messages", [])
+        last = messages[-1]["content"] if messages else ""
+        results = [block for block in last if isinstance(block, dict) and block.get("type") == "tool_result"] if isinstance(last, list) else []
+        if results: #second turn: answer using what the tools returned
+            text = "Here is what I found: " + " ".join(tool_result_text(block)[:300].strip() for block in results)
+            return [{"type": "text", "text": text}], "end_turn"
+        question = last if isinstance(last, str) else " ".join(block.get("text", "") for block in last if isinstance(block, dict))
+        call = pick_tool_call(question, request.get("tools", []))
+        if call is None:
+            return [{"type": "text", "text": "I don't have a tool for that, so here is a made up answer."}], "end_turn"
+        name, arguments = call
+        return [{"type": "text", "text": "Let me look that up."},
+                {"type": "tool_use", "id": f"toolu_{message_id}", "name": name, "input": arguments}], "tool_use"
+
+    def usage_for(self, request: dict, content: list[dict]) -> dict:
+        prefix = {"tools": request.get("tools", []), "system": request.get("system")}
+        prefix_tokens = estimate_tokens(prefix)
+        key = hashlib.md5(json.dumps(prefix, sort_keys=True).encode()).hexdigest()
+        input_tokens = estimate_tokens(request.get("messages", []))
+        with self.lock:
+            cached = key in self.cached_prefixes
+            self.cached_prefixes.add(key)
+            self.input_tokens += input_tokens
+        return {
+            "input_tokens": input_tokens,
+            "cache_creation_input_tokens": 0 if cached else prefix_tokens,
+            "cache_read_input_tokens": prefix_tokens if cached else 0,
+            "output_tokens": estimate_tokens(content),
+        }
+
+    def start(self) -> "StubLLMServer":
+        """Serve on a daemon thread and return self so callers can read base_url."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for Anthropic's Messages API (point the client at it with ANTHROPIC_BASE_URL)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--ttft", type=float, default=0.0, help="seconds before the first byte of each reply")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed text pieces")
+    args = parser.parse_args()
+    stub = StubLLMServer(args.host, args.port, args.ttft, args.token_delay)
+    print(f"Serving stub Messages API at {stub.base_url} (Ctrl+C to stop)")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server_close()
@@ -1,16 +1,24 @@
 import os #gives OS dependent functionality (here, copy environment variables and make file paths)
 import sys #accesses command line arguments and exits the script
+from urllib.parse import urlparse #splits a server URL into parts (we use the host name as the server's name)
 import asyncio #python library for writing concurrent code using async/await syntax. MCP uses asynchronous comm to handle network operations and i/o (RESEARCH THIS)
+import threading #reads the user's input on a daemon thread, see read_line
 from typing import Optional #Used for type hinting
+from collections.abc import AsyncIterator #type hint for async generators like stream_query (things you can "async for" over)
 from contextlib import AsyncExitStack  #research what a context manager is. "async with" W "multiple context managers" -> AsyncExitStack makes sure they're all entered 
 #and exited even if errors occur. This is good because MCP Client session and stdio transport are asynhronous resources need to be carefully shutdown
+from contextlib import nullcontext #do-nothing context manager, stands in for the tool semaphore when there's no concurrency cap
 
-from mcp import ClientSession, StdioServerParameters #importing the clients connection to the server, handling sending requests and getting responses according to MCP standard
-#defining how the MCP should launch and communication with the server through a different process instead of standard input/output (stdio)
+from mcp import StdioServerParameters #defining how the MCP should launch and communication with the server through a different process instead of standard input/output (stdio)
 ##RESEARCH: How does the MCP communicate server through that different process? Similarities/differences between that and input/output?
-from mcp.client.stdio import stdio_client
+##(the ClientSession + stdio_client that do the talking are opened in server_manager.py now)
+from mcp import types #MCP message types, used to spot the server's "tool list changed" notification
+from server_manager import ServerConfig, ServerManager, load_config #runs one or more servers (and replicas) and routes tool calls to them
+from telemetry import Span, Telemetry, profile_report #timing spans + metrics for each query (../telemetry/telemetry.py, shared with the weather server)
+from conversation import Conversation, ToolResultCache, tool_call_key #history across queries under a token budget, reused tool results (conversation.py)
 
-from anthropic import Anthropic #importxs main anthropic client class, lets you interact with Claude models
+from anthropic import AsyncAnthropic #importxs the async version of the main anthropic client class, lets you interact with Claude models
+##async version so waiting on claude doesn't freeze the event loop (and with it the MCP session) like the sync Anthropic() did
 ##Likely will need to use this since we're using Claude/AWS bedrock!
 from dotenv import load_dotenv #library which helps manage env variables from the .env file
 
@@ -18,22 +26,92 @@ load_dotenv()  # load environment variables from .env
 
 print("client.py is running! Imports loaded successfully.")
 
+async def read_line(prompt: str) -> str:
+    """input() without blocking the event loop or holding up shutdown
+
+    input() blocks until the user hits enter, so it runs on its own daemon thread and hands the line back through a future.
+    Not asyncio.to_thread: asyncio.run waits for its executor threads on exit, so Ctrl+C at the prompt would hang until enter
+
+    Args:
+        prompt: text shown before the cursor
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(line: Optional[str], error: Optional[BaseException]) -> None:
+        if future.done(): #the chat loop was cancelled while we were waiting
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(line)
+
+    def read() -> None:
+        try:
+            line, error = input(prompt), None
+        except BaseException as e: #EOFError when stdin is closed, passed on to the chat loop like input() would raise it
+            line, error = None, e
+        try:
+            loop.call_soon_threadsafe(settle, line, error)
+        except RuntimeError: #the loop already closed, nobody is waiting for this line anymore
+            pass
+
+    threading.Thread(target=read, daemon=True).start() #daemon: the interpreter exits without waiting for it
+    return await future
+
 class MCPClient: #class that has all logic/state to MCP client application
-    def __init__(self):
+    def __init__(self, max_concurrent_tools: int | None = None, tool_timeout: float | None = None, max_turns: int = 10, system_prompt: str | None = None,
+                 profile: bool | None = None, context_tokens: int | None = None, tool_result_ttl: float | None = None):
         #Called whenever you make a new instance of MCPClient, or when client = MCPClient()
-        self.session: Optional[ClientSession] = None #Once client successfully connects to MCP server holds the ClientSession object
-        #Optional part is indicating that the type could be ClientSession or None
+        #max_concurrent_tools: cap on how many tool calls from one turn run at the same time (None = no cap), env MCP_MAX_CONCURRENT_TOOLS
+        #tool_timeout: seconds before a single tool call is given up on (None = wait forever), env MCP_TOOL_TIMEOUT
+        #max_turns: how many times claude can ask for tools before we stop the loop, so a confused model can't loop forever
+        #system_prompt: optional instructions sent ahead of every conversation (cached along with the tools), env MCP_SYSTEM_PROMPT
+        #profile: print a breakdown of where each query's time went (LLM calls, tool calls, NWS requests) after it finishes, env MCP_PROFILE
+        #context_tokens: token budget for the conversation history sent with each LLM call (see conversation.py), env MCP_CONTEXT_TOKENS
+        #tool_result_ttl: seconds a read-only tool's result is reused for an identical call (same tool + arguments) instead of calling the server again, 0 = never, env MCP_TOOL_RESULT_TTL
+        self.servers = ServerManager(on_message=self.handle_server_message) #holds every server process + ClientSession we're connected to, and which tool lives where
         self.exit_stack = AsyncExitStack() #Manages life cycle of async. context managers- when this is called it makes sure that all stack's entered resources get properly shit down
-        self.anthropic = Anthropic() #Makes instance of Anthropic client, which interacts with Anthropic's Claude. 
+        self.exit_stack.push_async_callback(self.servers.stop) #stops every server process on cleanup
+        self.anthropic = AsyncAnthropic() #Makes instance of Anthropic client, which interacts with Anthropic's Claude. 
         ##NOTED: This automatically looks for that ANTHROPIC_API_KEY environment variable (loaded w load_dotenv()) to authenticate with API
+        if max_concurrent_tools is None and os.environ.get("MCP_MAX_CONCURRENT_TOOLS"):
+            max_concurrent_tools = int(os.environ["MCP_MAX_CONCURRENT_TOOLS"])
+        if tool_timeout is None and os.environ.get("MCP_TOOL_TIMEOUT"):
+            tool_timeout = float(os.environ["MCP_TOOL_TIMEOUT"])
+        self.tool_semaphore = asyncio.Semaphore(max_concurrent_tools) if max_concurrent_tools else None
+        self.tool_timeout = tool_timeout
+        self.max_turns = max_turns
+        self.system_prompt = system_prompt or os.environ.get("MCP_SYSTEM_PROMPT") or None
+        self.available_tools: Optional[list[dict]] = None #tool catalog in claude's format, fetched once per session (None = needs fetching)
+        self.query_usage: dict[str, int] = {} #token counts of the query that finished last (each query counts into its own dict, see stream_query)
+        #Telemetry: one trace per query, with a span per LLM call and per tool call - servers add theirs under the same trace id
+        ##MCP_OTLP_FILE appends every query's spans as OTLP/JSON lines, MCP_METRICS_FILE gets the Prometheus metrics on cleanup
+        self.telemetry = Telemetry("mcp-client", os.environ.get("MCP_OTLP_FILE"))
+        self.profile = profile if profile is not None else os.environ.get("MCP_PROFILE", "").lower() in ("1", "true", "yes")
+        self.last_trace_id: Optional[str] = None #trace of the most recent query, for profile_report
+        if context_tokens is None:
+            context_tokens = int(os.environ.get("MCP_CONTEXT_TOKENS", "16000"))
+        if tool_result_ttl is None:
+            tool_result_ttl = float(os.environ.get("MCP_TOOL_RESULT_TTL", "30"))
+        self.context_tokens = context_tokens
+        self.conversation = Conversation(context_tokens) #chat_loop's history, kept across queries so follow-up questions have context
+        self.tool_results = ToolResultCache(tool_result_ttl)
+        self.reusable_tools: set[str] = set() #tools the server marked readOnlyHint, the only ones whose results are reused/shared
+        self._inflight_tools: dict[str, asyncio.Task] = {} #tool_call_key -> the call already running for it, shared by identical calls
 
     #RESEARCH Coroutine (special type of function defined using async def syntax), in async. programming, when coroutine function is called it returns a coroutine object, which is an awaitable object 
     async def connect_to_server(self, server_script_path: str):
         """Connects to the Multi Client Protocol Server and contains the
         
         Args:
-            server_script_path: Holds the path to the .py or .js server script
+            server_script_path: Holds the path to the .py or .js server script, or the http(s):// URL of a server already running in HTTP mode
         """
+        if server_script_path.startswith(("http://", "https://")): #nothing to launch, just open a session to the running server
+            server_name = urlparse(server_script_path).hostname or "server"
+            await self.connect_to_servers([ServerConfig(server_name, url=server_script_path)])
+            return
+
         is_python = server_script_path.endswith('.py')
         is_js = server_script_path.endswith('.js')
         if not (is_python or is_js):
@@ -59,130 +137,270 @@ class MCPClient: #class that has all logic/state to MCP client application
             env=env #passes in modified env with the pythonpath adjustment from earlier! tells mcp to launch server subprocess with this specific env
         )
 
-        #Research asynchronous context managers in python!!
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        ##stdio_client takes those params and handles launching the server process and setting up comm standard input/output streams #RESEARCH!!
-        ##enters the stdio_client context manager - basically running the setup code of stdio_client and adding to asyncexitstack
-        ###makes sure that when .aclose() method is called later during cleanup, the stdio client will be properly exited, closing the pipes and stopping the server process
-        ###result is stdio_transport = tuple of (read_stream, write_stream)
-        self.stdio, self.write = stdio_transport
-        ##unpacks transport tuple into parts to read/write from/to server
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
-        ##Gives MCP ClientSession instance standard stdio_client I/O streams
-        ###ClientSession is a high-level interface to send MCP requests and receive responses
-        ###await part enters the ClientSession context manager and adds it to the exit stack for proper asynch cleanup
-        await self.session.initialize() #Sends initialize request to MCP server, client/server establish capabilities
+        server_name = os.path.splitext(os.path.basename(server_script_path))[0] #"weather.py" -> "weather"
+        await self.connect_to_servers([ServerConfig(server_name, server_params)])
+
+    async def connect_to_servers(self, configs: list[ServerConfig]):
+        """Starts every configured server at the same time and collects their tools
+        
+        Args:
+            configs: servers to launch, e.g. from server_manager.load_config("servers.json")
+        """
+        await self.servers.start(configs)
+        ##each server gets spawned, sent the initialize request (client/server establish capabilities) and asked for its tools,
+        ##all servers in parallel - see server_manager.py for how the stdio_client/ClientSession contexts are managed
 
         #after init, client asks and server responses w list of available tools that it exposes (research what "EXPOSES" is referencing)
-        response = await self.session.list_tools()
-        tools = response.tools #gets list of tool objects from response #these are the tools we made in the server code!
-        print("\nConnected to server with tools:", [tool.name for tool in tools]) #prints the names of the tools server advertised, confirming successful connection and tool discovery
-
-    async def process_query(self, query: str) -> str:
-        """Using Claude and any other tools that are available, process a query"""
-        messages = [ #Initializes Claude conversation history, each obj defines role (who said it) and content (what was said)
-            {
-                "role": "user",
-                "content": query
-            }
-        ]
-
-        response = await self.session.list_tools()
-        #Resource to reference: https://modelcontextprotocol.io/docs/concepts/tools 
-        available_tools = [{
-            "name": tool.name, 
-            "description" : tool.description, 
-            "input_schema": tool.inputSchema
-        } for tool in response.tools] #gets connected MCP server's tools and formats them into list of dictionaries, formatted according to anthropic's message's api tool parameter expectations
-        #https://docs.anthropic.com/en/api/messages
-        #https://docs.aws.amazon.com/bedrock/latest/userguide/model-parameters-anthropic-claude-messages.html 
-
-        #Calls Anthropic's Claude API
-        response = self.anthropic.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000, #max number of tokens claude can generate in response 
-            ##Interestingly, when you google this it says claude 3.5 sonnet can have a max of 4,096 tokens. Is 1000 better to use for applications to ensure you use less memory? Can play around with this number
-            ###Potential ideas here: cost control (prevents unnecessarily long outputs), latency management (better response time for real-time applications), avoid incomplete responses, more focused and concist
-            messages = messages, #gives current conversation history to claude
-            tools = available_tools #tell claude about functions it can call, claude decides if it needs a tool to answer the query
-        )
+        tools = await self.get_tools() #gets list of tools from the servers (and caches it so queries don't have to ask again) #these are the tools we made in the server code!
+        print("\nConnected to servers with tools:", [tool["name"] for tool in tools]) #prints the names of the tools servers advertised, confirming successful connection and tool discovery
+
+    async def get_tools(self) -> list[dict]:
+        """Returns the server's tools in the format claude's api expects, only asking the server when the cache is empty"""
+        if self.available_tools is None:
+            await self.servers.refresh_tools() #only re-asks servers that said their tools changed
+            #Resource to reference: https://modelcontextprotocol.io/docs/concepts/tools 
+            tools = [{
+                "name": tool.name, 
+                "description" : tool.description, 
+                "input_schema": tool.inputSchema
+            } for tool in self.servers.tools] #formats them into list of dictionaries, formatted according to anthropic's message's api tool parameter expectations
+            #https://docs.anthropic.com/en/api/messages
+            #https://docs.aws.amazon.com/bedrock/latest/userguide/model-parameters-anthropic-claude-messages.html 
+            if tools:
+                tools[-1]["cache_control"] = {"type": "ephemeral"}
+                ##prompt caching: marks the end of the tool list as a cache breakpoint, so claude's api reuses the already-processed
+                ##tool schemas on later calls instead of charging/prefilling them as fresh input every time
+                ##https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching
+            self.available_tools = tools
+            self.reusable_tools = {tool.name for tool in self.servers.tools if tool.annotations is not None and tool.annotations.readOnlyHint}
+        return self.available_tools
+
+    async def handle_server_message(self, message) -> None:
+        """Drops the cached tool list when the server says its tools changed (notifications/tools/list_changed)"""
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            self.available_tools = None #next query will fetch the fresh list
+
+    async def process_query(self, query: str, conversation: Optional[Conversation] = None) -> str:
+        """Using Claude and any other tools that are available, process a query and return the whole answer at once"""
+        return "".join([chunk async for chunk in self.stream_query(query, conversation)]) #collects every streamed piece into one string
+
+    async def stream_query(self, query: str, conversation: Optional[Conversation] = None) -> AsyncIterator[str]:
+        """Same as process_query, but yields the answer piece by piece as Claude writes it
+        
+        Use it with "async for chunk in client.stream_query(query)" to show text as soon as it arrives,
+        so the user waits for the first token instead of the last one
+        
+        Args:
+            query: the user's question
+            conversation: history to continue (e.g. self.conversation), None = a one-off query with no history
+            ##the query's token counts end up in conversation.usage (and self.query_usage, for the query that finished last)
+            ##one conversation shouldn't run two queries at the same time, their messages would interleave
+        """
+        if conversation is None:
+            conversation = Conversation(self.context_tokens)
+        query_span = self.telemetry.start_span("query", query_chars=len(query)) #root of this query's trace
+        self.last_trace_id = query_span.trace_id
+        conversation.begin(query)
+        usage = {"input_tokens": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0, "output_tokens": 0} #this query's token counts
+        try:
+            async for chunk in self._run_query(conversation, query_span, usage):
+                yield chunk
+        except BaseException as e: #includes the caller abandoning the stream early
+            conversation.rollback() #a half finished exchange (tool_use without its results) would make every later call fail
+            self.telemetry.end_span(query_span, e)
+            raise
+        query_span.set(**usage)
+        self.query_usage = conversation.usage = usage #whole dicts are swapped in, so queries running at the same time can't mix their counts
+        self.telemetry.end_span(query_span)
+
+    async def _run_query(self, conversation: Conversation, query_span: Span, usage: dict[str, int]) -> AsyncIterator[str]:
+        #the agent loop behind stream_query, every LLM call and tool call gets a span under query_span
+        messages = conversation.messages #Claude conversation history, each obj defines role (who said it) and content (what was said) - the question is already in it
+
+        available_tools = await self.get_tools() #cached since connect_to_server, no extra round trip to the MCP server per query
+        extra_args = {}
+        if self.system_prompt: #system prompt goes right after the tools, so it's cached as part of the same stable prefix
+            extra_args["system"] = [{"type": "text", "text": self.system_prompt, "cache_control": {"type": "ephemeral"}}]
 
-        final_text = [] #list to get parts of final response that will get shown to user
-        assistant_manage_content = [] #list to keep all of the assistant's parts of the message (text/tool_use) which get sent back to claude if a tool is used
-        #RESEARCH: What does this 'assistant' exactly mean? Where and how does it relate to the server code?
-        for content in response.content: #in the case when claude just gives a direct text response (doesn't need a tool or is done with tool use)
-            if content.type == 'text':
-                final_text.append(content.text) #adds text to the output list
-                assistant_manage_content.append(content) #adds text content to assistant's turn
-                ##Research into assistant's turn meaning, and what does "more turns needed" means? Is this when LLMs regenerate responses within their response or self correct, or something else?
-            elif content.type == 'tool_use':
-                tool_name = content.name #name of tool claude wants to call
-                tool_args = content.input #args claude gives for the tool call, like a dictionary
-                result = await self.session.call_tool(tool_name, tool_args) #sends call_tool request to mcp server w claude's tool name & args given by claude
-                ##would execute one of our server's functions, like get_forecast, and result has the output from the server
-                final_text.append(f"[Calling tool {tool_name} with args {tool_args}]")
+        #Agent loop: ask claude, run every tool it asked for AT THE SAME TIME, send all the results back in one message, repeat
+        ##before, each tool_use block was run one after another and each one got its own extra claude call,
+        ##so 3 tools = 3 serial tool latencies + 3 claude calls. Now 3 tools in one turn = 1 (parallel) tool latency + 1 claude call
+        for turn in range(self.max_turns):
+            context_tokens = conversation.compact() #trims the history to the token budget before every call, not just once per query
+            llm_span = self.telemetry.start_span("llm.messages", query_span, turn=turn, context_tokens=context_tokens, context_messages=len(messages))
+            #Calls Anthropic's Claude API in streaming mode - text arrives in small pieces (events) while claude is still writing
+            async with self.anthropic.messages.stream(
+                model="claude-3-5-sonnet-20241022",
+                max_tokens=1000, #max number of tokens claude can generate in response 
+                ##Interestingly, when you google this it says claude 3.5 sonnet can have a max of 4,096 tokens. Is 1000 better to use for applications to ensure you use less memory? Can play around with this number
+                ###Potential ideas here: cost control (prevents unnecessarily long outputs), latency management (better response time for real-time applications), avoid incomplete responses, more focused and concist
+                messages = conversation.api_messages(), #gives current conversation history to claude
+                tools = available_tools, #tell claude about functions it can call, claude decides if it needs a tool to answer the query
+                **extra_args
+            ) as stream:
+                async for event in stream:
+                    if "ttft_ms" not in llm_span.attributes: #time until claude's first event - the wait before generation starts
+                        llm_span.set(ttft_ms=round(llm_span.duration_ms, 3))
+                    if event.type == 'text':
+                        yield event.text #hands each piece of text to the caller right away
+                    elif event.type == 'content_block_stop' and event.content_block.type == 'text':
+                        yield "\n" #end of a text block, keeps it on its own line(s) like the old "\n".join did
+                response = await stream.get_final_message() #the full message (text + tool_use blocks), same shape messages.create returned
+            self._record_llm_call(llm_span, response)
+            for key in usage: #input_tokens = uncached input, cache_read = served from the prompt cache, cache_creation = written to it
+                usage[key] += getattr(response.usage, key, None) or 0
+
+            tool_uses = [content for content in response.content if content.type == 'tool_use'] #every tool_use block claude sent this turn
+            for tool_use in tool_uses:
+                yield f"[Calling tool {tool_use.name} with args {tool_use.input}]\n"
                 ##adds msge to output that is human readable for transparency to let user know what tool is being called (can see this in claude)
 
-                assistant_manage_content.append(content) #adds tool_use block (content obj generated by claude, whre it says to answer this i need to run funct X with args Y) to assistants turn 
-                #Tool use content block: https://docs.anthropic.com/en/docs/agents-and-tools/tool-use/implement-tool-use
-                messages.append({ #Assistants turn with tool_use, adds assistance turn to convo history, including tool_use block telling claude what action it took
-                    "role": "assistant", 
-                    "content": assistant_manage_content
-                })
-                messages.append({ #users turn w tool_result - add "tool_result" message to conversation history
-                    # Reference my "intermediary or an agent between the human user and the AI model (Claude) and the MCP server (which provides the tools)" OneNote notes for this part to understand
-                    "role": "user", 
-                    "content": [
-                    {
-                            "type": "tool_result", 
-                            "tool_use_id": content.id,
-                            "content": result.content
-                    }
-                    ]
-                })
-
-                #after tool result, entire convo history (including tool call and result) sent back to claude
-                #claude makes a new response (might be final answer) or another tool call. loop continues until claude gives text response
-                response = self.anthropic.messages.create( 
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=1000,
-                    messages=messages, 
-                    tools=available_tools
-                )
-
-                final_text.append(response.content[0].text) #adds in the text from claude's prev response
-
-        return "\n".join(final_text) #joins all collected text + tool call msges into single string, separated by newlines, and returns into chatloop
+            if not tool_uses: #claude answered without asking for tools, so we're done
+                messages.append({"role": "assistant", "content": response.content}) #the answer stays in the history for follow-up questions
+                break
+
+            #Assistant's turn goes into the history exactly as claude sent it (text + every tool_use block)
+            #Tool use content block: https://docs.anthropic.com/en/docs/agents-and-tools/tool-use/implement-tool-use
+            messages.append({
+                "role": "assistant", 
+                "content": response.content
+            })
+            #asyncio.gather starts all the tool calls at once and waits until every one has finished, results come back in the same order
+            tool_results = await asyncio.gather(*(self.call_tool(tool_use, query_span) for tool_use in tool_uses))
+            messages.append({ #users turn w ALL the tool_results in one message, claude sees them together on the next loop
+                # Reference my "intermediary or an agent between the human user and the AI model (Claude) and the MCP server (which provides the tools)" OneNote notes for this part to understand
+                "role": "user", 
+                "content": list(tool_results)
+            })
+        else:
+            yield f"[Stopped after {self.max_turns} rounds of tool calls]\n"
+            #history has to alternate user/assistant, so the dangling tool results get an answer before the next question
+            messages.append({"role": "assistant", "content": f"[Stopped after {self.max_turns} rounds of tool calls]"})
+
+    def _record_llm_call(self, llm_span: Span, response) -> None:
+        usage = {key: getattr(response.usage, key, None) or 0 for key in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")}
+        llm_span.set(model=response.model, stop_reason=response.stop_reason, **usage)
+        self.telemetry.end_span(llm_span)
+        self.telemetry.count("mcp_client_llm_calls_total", model=response.model, stop_reason=response.stop_reason)
+        for key, value in usage.items():
+            self.telemetry.count("mcp_client_llm_tokens_total", value, type=key.removesuffix("_tokens"))
+
+    async def call_tool(self, tool_use, parent: Optional[Span] = None) -> dict:
+        """Runs one tool_use block on the MCP server and turns the outcome into a tool_result block
+        
+        For read-only tools, a recent result of the same call (same tool + arguments) is reused instead of asking
+        the server again, and identical calls running at the same time (e.g. two in one turn) share one server call
+        
+        Args:
+            tool_use: tool_use content block from claude's response (has id, name, input)
+            parent: span to record this call under (the query's span), the server's spans join it through the traceparent
+        """
+        if tool_use.name not in self.reusable_tools: #calling it twice might do something twice, so always run it
+            return await self._traced_call_tool(tool_use, parent)
+        key = tool_call_key(tool_use.name, tool_use.input)
+        content = self.tool_results.get(key)
+        if content is not None:
+            self.telemetry.count("mcp_client_tool_calls_total", tool=tool_use.name, status="reused")
+            return {"type": "tool_result", "tool_use_id": tool_use.id, "content": content, "is_error": False}
+        task = self._inflight_tools.get(key)
+        if task is None: #nobody is running this call yet
+            task = asyncio.create_task(self._traced_call_tool(tool_use, parent))
+            self._inflight_tools[key] = task
+            task.add_done_callback(lambda _: self._inflight_tools.pop(key, None))
+        else:
+            self.telemetry.count("mcp_client_tool_calls_total", tool=tool_use.name, status="coalesced")
+        result = await asyncio.shield(task) #shield: one caller being cancelled shouldn't cancel the call another is waiting on
+        if not result["is_error"]:
+            self.tool_results.put(key, result["content"])
+        return dict(result, tool_use_id=tool_use.id) #the shared result still has to answer this tool_use block
+
+    async def _traced_call_tool(self, tool_use, parent: Optional[Span]) -> dict:
+        with self.telemetry.span(f"tools/call {tool_use.name}", parent, tool=tool_use.name) as span:
+            result = await self._call_tool(tool_use, span)
+            span.set(is_error=result["is_error"])
+        self.telemetry.count("mcp_client_tool_calls_total", tool=tool_use.name, status="error" if result["is_error"] else "ok")
+        return result
+
+    async def _call_tool(self, tool_use, span: Span) -> dict:
+        try:
+            async with self.tool_semaphore or nullcontext(): #waits here if max_concurrent_tools calls are already running
+                span.set(queue_ms=round(span.duration_ms, 3))
+                result = await asyncio.wait_for(self.servers.call_tool(tool_use.name, tool_use.input, meta={"traceparent": span.traceparent()}), self.tool_timeout)
+                #sends call_tool request to the mcp server that owns this tool w claude's tool name & args, wait_for gives up after tool_timeout seconds (None = never)
+                #the traceparent in _meta lets the server record its spans under this one
+        except asyncio.TimeoutError:
+            return {"type": "tool_result", "tool_use_id": tool_use.id, "content": f"Tool {tool_use.name} timed out after {self.tool_timeout}s", "is_error": True}
+        except Exception as e: #one failing tool shouldn't throw away the results of the others, claude gets told it failed instead
+            return {"type": "tool_result", "tool_use_id": tool_use.id, "content": f"Tool {tool_use.name} failed: {e}", "is_error": True}
+        return {
+            "type": "tool_result", 
+            "tool_use_id": tool_use.id,
+            "content": [{"type": "text", "text": block.text} for block in result.content if block.type == "text"], #only the fields claude's api accepts
+            "is_error": bool(result.isError)
+        }
+
+    async def profile_report(self, trace_id: Optional[str] = None) -> str:
+        """Where a query's time went: this client's spans plus every server's spans for the same trace, as a tree
+        
+        Args:
+            trace_id: trace to show, defaults to the most recent query
+        """
+        trace_id = trace_id or self.last_trace_id
+        if trace_id is None:
+            return "(no query yet)"
+        spans = self.telemetry.trace(trace_id)
+        spans += [Span.from_otlp(span, "server") for span in await self.servers.read_trace(trace_id)]
+        return profile_report(spans)
 
     async def chat_loop(self): #async method implements interactive chat interface
         """Implements the interactive chat interface loop"""
         print("\nMCP Client started!")
-        print("Type your queries or 'quit' to exit.")
+        print("Type your queries, 'clear' to start a new conversation or 'quit' to exit.")
 
         while True: #infinite loop so user can put in multiple queries
             try: #handles if anything goes wrong lik enetwork issue, claude api error, or tool call unexpected error
-                query = input("\nQuery: ").strip() #prompts user to put in a query, reading line from stdin and .strip() removes any whitespace from beginning or end
+                query = (await read_line("\nQuery: ")).strip() #prompts user to put in a query, reading line from stdin and .strip() removes any whitespace from beginning or end
+                ##read_line waits for enter on another thread - the event loop (and the MCP session) keeps running meanwhile
 
                 if query.lower() == 'quit':
                     break #case insensitive, if user types in quit ends the chat sesh
+                if query.lower() == 'clear':
+                    self.conversation.clear() #forget the history, earlier questions won't be sent anymore
+                    print("Started a new conversation.")
+                    continue
 
-                response = await self.process_query(query) #calls process_query method w user input. since process_query is an async method, needs to use await keyword bc needs to be awaited
-                print("\n" + response) #print the response from process_query (which has claude answer and any tool call msges
+                print()
+                async for chunk in self.stream_query(query, self.conversation): #prints claude's answer (and any tool call msges) as it's being written
+                    print(chunk, end="", flush=True) #flush so each piece shows up immediately instead of waiting in the output buffer
+                usage = self.conversation.usage
+                print(f"[tokens: {usage['input_tokens']} uncached input, {usage['cache_read_input_tokens']} cached input, "
+                      f"{usage['cache_creation_input_tokens']} written to cache, {usage['output_tokens']} output, "
+                      f"history ~{self.conversation.tokens()}/{self.conversation.token_budget}]")
+                if self.profile: #--profile: per-query breakdown of LLM calls, tool calls and the server's NWS requests
+                    print(await self.profile_report())
             except Exception as e:
                 print(f"\nError: {str(e)}")
 
     async def cleanup(self): #async method responsible for shutting down client and releasing resources
         """Clean up resources"""
-        await self.exit_stack.aclose() #key line for cleanup - closes the standard i/o pipes to server, stops server process, and cleans up mcp client sesh
+        await self.exit_stack.aclose() #key line for cleanup - closes the standard i/o pipes to servers, stops server processes, and cleans up mcp client sessions
+        self.telemetry.flush()
+        if os.environ.get("MCP_METRICS_FILE"): #Prometheus text file, e.g. for node_exporter's textfile collector
+            with open(os.environ["MCP_METRICS_FILE"], "w") as f:
+                f.write(self.telemetry.prometheus_text())
 
 async def main():
-    if len(sys.argv) < 2: #sys.argv is a list in python w command line args passed into script. [0] index just has the script name
-        print("Usage: python client.py <path_to_server_script>") #if less than two args provided, (script expects one arg path to serever script), if it's less than 2 then the req server path wasn't given
+    args = [arg for arg in sys.argv[1:] if arg != "--profile"] #--profile can go anywhere on the command line
+    if len(args) < 1: #sys.argv is a list in python w command line args passed into script. [0] index just has the script name
+        print("Usage: python client.py [--profile] <path_to_server_script | server_url> | --config <servers.json>") #if less than two args provided, (script expects one arg path to serever script), if it's less than 2 then the req server path wasn't given
         sys.exit(1) #exits script w error code, since 1 indicates error
-    client = MCPClient()
+    client = MCPClient(profile=True if "--profile" in sys.argv else None)
     try:
         print("Trying to connect to server...")
-        await client.connect_to_server(sys.argv[1]) #calls connect_to_server method to get connection to the server
+        if args[0] == "--config" and len(args) > 1: #several servers from a config file, see server_manager.py for the format
+            await client.connect_to_servers(load_config(args[1]))
+        else:
+            await client.connect_to_server(args[0]) #calls connect_to_server method to get connection to the server
         ##[1] is the path to the server script - check if there's a [2] or if this only ever has a [0] or [1] index
         print("Server connection successful. Starting chat loop...")
         await client.chat_loop() #after connected, this puts in the client into interactive chat loop so they can send queries
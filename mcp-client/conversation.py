@@ -0,0 +1,194 @@
+#Conversation history that lasts across queries, kept under a token budget (used by client.py)
+#Before, every query started a fresh messages list: follow-up questions lost all context and claude re-ran tools it had
+#already run, while inside one query every raw tool_result stayed in the history and was re-sent on every LLM call
+#What it does:
+##keeps the messages of every exchange (user question -> tool calls -> answer) so follow-ups can refer back to them
+##compact() runs before each LLM call, cheapest step first, and stops as soon as the history fits the budget:
+###1. an older tool_result identical to a newer one (same tool, same arguments) is replaced by a pointer to the newer one
+###2. tool results from earlier exchanges are cut down to a short preview - claude already answered from them, and its
+###   answer is still in the history (the full result is one cheap, usually cached, tool call away if it's needed again)
+###3. over budget: tool results of the current exchange are previewed too, except the newest ones claude hasn't read yet
+###4. still over budget: whole exchanges are dropped, oldest first (never the current one)
+##the budget counts the messages only - the tool list and system prompt are a fixed, prompt-cached prefix
+##tokens are estimated at ~4 characters each, no extra api round trip (the real counts come back in response.usage)
+#ToolResultCache: results of identical tool calls (same name + arguments) are reused for a short while instead of calling
+#the server again, and identical calls that are already running are shared (see call_tool in client.py)
+##only for tools the server marks readOnlyHint (calling them twice can't change anything), and never for failures - tools
+##often report those as plain text (weather.py: "Cannot get detailed forecast :(") instead of setting is_error
+##kept short on purpose: the server already caches upstream data for as long as the upstream says it's fresh
+
+import json
+import re
+import time
+from typing import Any, Optional
+
+CHARS_PER_TOKEN = 4 #rough average for english text and JSON, good enough for budgeting
+TRUNCATED_MARKER = "...[truncated {omitted} chars, call the tool again for the full result]"
+FAILURE_TEXT = re.compile(r"\s*(cannot|can't|could not|couldn't|unable|error|failed|failure)\b", re.IGNORECASE) #how failed tool results usually start
+
+
+def estimate_tokens(value: Any) -> int:
+    """Rough token count of a message, content block or string"""
+    if not isinstance(value, str):
+        value = json.dumps(value, default=_jsonable)
+    return len(value) // CHARS_PER_TOKEN + 1
+
+
+def _jsonable(value: Any) -> Any:
+    #assistant messages hold the SDK's content block objects (TextBlock, ToolUseBlock), not dicts
+    return value.model_dump() if hasattr(value, "model_dump") else str(value)
+
+
+def _field(block: Any, name: str) -> Any:
+    return block.get(name) if isinstance(block, dict) else getattr(block, name, None)
+
+
+def tool_call_key(name: str, arguments: Optional[dict]) -> str:
+    """Same string for calls with the same tool and arguments, whatever order claude wrote the arguments in"""
+    return f"{name}:{json.dumps(arguments or {}, sort_keys=True)}"
+
+
+def looks_like_failure(content: Any) -> bool:
+    """True when a tool result's text starts like an error message, even though is_error wasn't set"""
+    text = result_text({"content": content})
+    return not text.strip() or FAILURE_TEXT.match(text) is not None
+
+
+def result_text(block: dict) -> str:
+    """Text of a tool_result block (content is either a string or a list of text blocks)"""
+    content = block.get("content", "")
+    if isinstance(content, str):
+        return content
+    return "\n".join(part.get("text", "") for part in content if part.get("type") == "text")
+
+
+class Conversation:
+    def __init__(self, token_budget: int = 16000, preview_chars: int = 600):
+        #token_budget: most tokens (estimated) of history sent with each LLM call
+        #preview_chars: how much of an old tool result is kept when it gets cut down
+        self.token_budget = token_budget
+        self.preview_chars = preview_chars
+        self.messages: list[dict] = []
+        self.current_start = 0 #index of the current exchange's question, everything before it is "old"
+        self.compactions = {"previewed": 0, "deduplicated": 0, "dropped_exchanges": 0} #running totals, for stats/telemetry
+        self._result_hashes: dict[str, int] = {} #tool_use_id -> hash of the full result, taken before it was ever compacted
+        self.usage: dict[str, int] = {} #token counts of this conversation's most recent query (set by client.stream_query)
+
+    def begin(self, query: str) -> None:
+        """Starts a new exchange with the user's question"""
+        self.current_start = len(self.messages)
+        self.messages.append({"role": "user", "content": query})
+
+    def rollback(self) -> None:
+        """Forgets the current exchange, e.g. when the query failed halfway and the history would end on an unanswered tool_use"""
+        del self.messages[self.current_start:]
+
+    def clear(self) -> None:
+        self.messages.clear()
+        self.current_start = 0
+        self._result_hashes.clear()
+
+    def tokens(self) -> int:
+        return sum(estimate_tokens(message) for message in self.messages)
+
+    def compact(self) -> int:
+        """Shrinks the history until it fits the token budget (see the steps at the top of this file), returns its estimated size"""
+        self._dedupe_results() #steps 1 and 2 always run: repeats and answered results are just dead weight
+        self._preview_results(0, self.current_start)
+        tokens = self.tokens()
+        if tokens > self.token_budget: #step 3: everything except the newest tool_result message
+            newest = max((i for i, message in enumerate(self.messages) if self._tool_results(message)), default=len(self.messages))
+            self._preview_results(self.current_start, newest)
+            tokens = self.tokens()
+        while tokens > self.token_budget and self.current_start > 0: #step 4
+            end = self._next_exchange(1)
+            for message in self.messages[:end]:
+                for block in self._tool_results(message):
+                    self._result_hashes.pop(block["tool_use_id"], None)
+            del self.messages[:end]
+            self.current_start -= end
+            self.compactions["dropped_exchanges"] += 1
+            tokens = self.tokens()
+        return tokens
+
+    def _tool_results(self, message: dict) -> list[dict]:
+        if message["role"] != "user" or isinstance(message["content"], str):
+            return []
+        return [block for block in message["content"] if isinstance(block, dict) and block.get("type") == "tool_result"]
+
+    def _next_exchange(self, start: int) -> int:
+        #index of the next user question (a user message that isn't tool results) at or after start
+        for i in range(start, len(self.messages)):
+            if self.messages[i]["role"] == "user" and not self._tool_results(self.messages[i]):
+                return i
+        return len(self.messages)
+
+    def _preview_results(self, start: int, end: int) -> None:
+        for message in self.messages[start:end]:
+            for block in self._tool_results(message):
+                text = result_text(block)
+                if block.get("compacted") or len(text) <= self.preview_chars:
+                    continue
+                cut = text.rfind("\n", 0, self.preview_chars) #ends the preview on a whole line when there is one
+                cut = cut if cut > self.preview_chars // 2 else self.preview_chars
+                block["content"] = [{"type": "text", "text": text[:cut] + "\n" + TRUNCATED_MARKER.format(omitted=len(text) - cut)}]
+                block["compacted"] = "preview" #not sent to the api, see api_messages
+                self.compactions["previewed"] += 1
+
+    def _dedupe_results(self) -> None:
+        #tool_use_id -> which call it was, from the assistant messages' tool_use blocks
+        calls = {}
+        for message in self.messages:
+            if message["role"] == "assistant" and not isinstance(message["content"], str):
+                for block in message["content"]:
+                    if _field(block, "type") == "tool_use":
+                        calls[_field(block, "id")] = tool_call_key(_field(block, "name"), _field(block, "input"))
+        newest: dict[tuple[str, int], str] = {} #(call, result hash) -> tool_use_id of the newest copy
+        for message in reversed(self.messages):
+            for block in self._tool_results(message):
+                if block.get("is_error") or block["tool_use_id"] not in calls:
+                    continue
+                #previews no longer hold the whole result, so results are compared by the hash of their full text
+                key = (calls[block["tool_use_id"]], self._result_hashes.setdefault(block["tool_use_id"], hash(result_text(block))))
+                if key not in newest:
+                    newest[key] = block["tool_use_id"]
+                elif block.get("compacted") != "duplicate":
+                    block["content"] = [{"type": "text", "text": f"[same result as tool call {newest[key]} further down]"}]
+                    block["compacted"] = "duplicate"
+                    self.compactions["deduplicated"] += 1
+
+    def api_messages(self) -> list[dict]:
+        """The history in the shape claude's api accepts (drops our "compacted" bookkeeping flag)"""
+        return [
+            {**message, "content": [{k: v for k, v in block.items() if k != "compacted"} for block in message["content"]]}
+            if self._tool_results(message) else message
+            for message in self.messages
+        ]
+
+
+class ToolResultCache:
+    """Recent successful tool results by tool_call_key, reused for ttl seconds"""
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 256):
+        self.ttl = ttl #0 turns reuse off
+        self.max_entries = max_entries
+        self.entries: dict[str, tuple[float, Any]] = {} #key -> (expires at, tool_result content)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, content: Any) -> None:
+        if self.ttl <= 0 or looks_like_failure(content): #a temporary failure shouldn't be replayed
+            return
+        self.entries.pop(key, None)
+        if len(self.entries) >= self.max_entries: #dicts keep insertion order, so the first key is the oldest
+            self.entries.pop(next(iter(self.entries)))
+        self.entries[key] = (time.monotonic() + self.ttl, content)
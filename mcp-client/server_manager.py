@@ -0,0 +1,274 @@
+#Runs several MCP servers side by side for one MCPClient (used by client.py)
+#What it does:
+##starts every configured server (and every replica of it) at the same time, so startup takes as long as the slowest server
+##instead of the sum of all of them
+##builds a routing table from the tool names claude sees to (server, real tool name) - when more than one server is
+##configured, tool names get the server name in front ("weather__get_forecast") so two servers can both have a "search" tool
+##sends each call_tool to the least busy replica of that server, so CPU-heavy tools spread over several processes/cores
+##restarts a server process that crashed, and retries the call once on a healthy replica if the tool is marked readOnlyHint
+##(any other tool might have done part of its work already, or be what crashed the process - it would take the next one down too)
+##passes request metadata (the query's trace id) along with each call_tool, and collects a trace's spans back from servers
+##that publish them as a "<scheme>://traces/{trace_id}" resource template (weather.py does)
+
+#Servers are either launched as local subprocesses over stdio ("command") or reached over streamable HTTP ("url")
+#Config file format (same "mcpServers" shape Claude Desktop uses, plus an optional "replicas" count):
+#{
+#  "mcpServers": {
+#    "weather": {"command": "python", "args": ["../weather/weather.py"], "env": {"NWS_HTTP2": "0"}, "replicas": 2},
+#    "shared-weather": {"url": "http://localhost:8000/mcp"}
+#  }
+#}
+
+import asyncio
+import json
+import os
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import anyio
+from mcp import ClientSession, StdioServerParameters, McpError, types
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+
+NAMESPACE_SEPARATOR = "__" #claude's api only allows letters, numbers, _ and - in tool names, so no "." or "/"
+
+MessageHandler = Callable[[Any], Awaitable[None]]
+
+
+@dataclass
+class ServerConfig:
+    name: str #short name, also used as the tool namespace
+    params: Optional[StdioServerParameters] = None #how to launch it (command, args, env, cwd), for stdio servers
+    replicas: int = 1 #how many copies of the process to run (for url servers: how many sessions to open)
+    url: Optional[str] = None #streamable HTTP endpoint, e.g. http://localhost:8000/mcp, used instead of params
+
+
+def load_config(path: str) -> list[ServerConfig]:
+    """Reads a JSON config file with an "mcpServers" object into a list of ServerConfigs
+
+    Args:
+        path: path to the JSON config file
+    """
+    with open(path) as f:
+        raw = json.load(f)
+    configs = []
+    for name, entry in raw.get("mcpServers", {}).items():
+        replicas = max(1, int(entry.get("replicas", 1)))
+        if "url" in entry:
+            configs.append(ServerConfig(name, replicas=replicas, url=entry["url"]))
+            continue
+        env = os.environ.copy() #server gets the client's environment, plus anything the config adds
+        env.update(entry.get("env", {}))
+        params = StdioServerParameters(command=entry["command"], args=entry.get("args", []), env=env, cwd=entry.get("cwd"))
+        configs.append(ServerConfig(name, params, replicas))
+    return configs
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """True when a call failed because the server process is gone, rather than because the tool itself failed"""
+    if isinstance(error, McpError):
+        return error.error.code == types.CONNECTION_CLOSED
+    return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, BrokenPipeError, ConnectionError))
+
+
+class ServerConnection:
+    """One running server process (or HTTP session) and its ClientSession
+
+    The stdio_client/ClientSession context managers are entered and exited inside one dedicated task (_run),
+    because anyio requires a context to be closed by the same task that opened it - that's what lets us stop and
+    restart a single server at any time without touching the others.
+    """
+
+    def __init__(self, config: ServerConfig, on_message: Optional[MessageHandler] = None):
+        self.config = config
+        self.on_message = on_message
+        self.session: Optional[ClientSession] = None
+        self.capabilities: Optional[types.ServerCapabilities] = None #what the server said it supports in initialize
+        self.tools: list[types.Tool] = []
+        self.trace_template: Optional[str] = None #uri template of the server's trace resource, "" if it has none (see read_trace)
+        self.tools_stale = False #set when the server sends notifications/tools/list_changed
+        self.in_flight = 0 #tool calls currently running on this process, used for load balancing
+        self.healthy = False
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        """Spawns the server, runs initialize + list_tools, and returns once it's ready (raises if it failed to start)"""
+        self._stop = asyncio.Event()
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(ready))
+        await ready
+
+    async def _run(self, ready: asyncio.Future) -> None:
+        try:
+            #stdio_client launches the server process and gives us its (read_stream, write_stream) pipes,
+            #streamablehttp_client gives the same streams backed by HTTP requests to an already running server
+            transport = streamablehttp_client(self.config.url) if self.config.url else stdio_client(self.config.params)
+            async with transport as (read, write, *_): #the HTTP client also hands back a session id getter we don't need
+                async with ClientSession(read, write, message_handler=self._handle_message) as session:
+                    self.capabilities = (await session.initialize()).capabilities #client/server establish capabilities
+                    self.tools = (await session.list_tools()).tools
+                    self.session = session
+                    self.healthy = True
+                    ready.set_result(None)
+                    await self._stop.wait() #keeps the contexts open until stop() is called
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            self.session = None
+            self.healthy = False
+
+    async def _handle_message(self, message) -> None:
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            self.tools_stale = True
+        if self.on_message is not None:
+            await self.on_message(message)
+
+    async def refresh_tools(self) -> None:
+        self.tools = (await self.session.list_tools()).tools
+        self.tools_stale = False
+
+    async def read_trace(self, trace_id: str) -> list[dict]:
+        """This server's spans for a trace (OTLP/JSON span dicts), empty if it doesn't publish traces"""
+        if self.trace_template is None: #looked up once per connection
+            self.trace_template = ""
+            if self.capabilities is not None and self.capabilities.resources is not None:
+                templates = (await self.session.list_resource_templates()).resourceTemplates
+                self.trace_template = next((t.uriTemplate for t in templates if t.uriTemplate.endswith("/traces/{trace_id}")), "")
+        if not self.trace_template:
+            return []
+        contents = (await self.session.read_resource(self.trace_template.replace("{trace_id}", trace_id))).contents
+        if not contents or not hasattr(contents[0], "text"):
+            return []
+        exported = json.loads(contents[0].text)
+        return [span for resource in exported.get("resourceSpans", []) for scope in resource["scopeSpans"] for span in scope["spans"]]
+
+    async def stop(self) -> None:
+        """Closes the session and the server process"""
+        if self._task is not None:
+            self._stop.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class ServerManager:
+    """All configured servers, their replicas, and the tool -> server routing table"""
+
+    def __init__(self, on_message: Optional[MessageHandler] = None):
+        self.on_message = on_message #called with every notification any server sends
+        self.replicas: dict[str, list[ServerConnection]] = {}
+        self.routes: dict[str, tuple[str, str]] = {} #tool name claude sees -> (server name, real tool name)
+        self.tools: list[types.Tool] = [] #every routed tool, renamed to the name claude sees
+        self.retryable: set[str] = set() #tool names claude sees that the server marked readOnlyHint, safe to send again after a crash
+        self._restart_locks: dict[int, asyncio.Lock] = {}
+
+    async def start(self, configs: list[ServerConfig]) -> None:
+        """Starts every server and replica concurrently, then builds the routing table
+
+        Servers that fail to start are reported and skipped, it only raises if none of them started
+
+        Args:
+            configs: servers to launch
+        """
+        connections = [(config.name, ServerConnection(config, self.on_message)) for config in configs for _ in range(config.replicas)]
+        results = await asyncio.gather(*(connection.start() for _, connection in connections), return_exceptions=True)
+        errors = []
+        for (name, connection), result in zip(connections, results):
+            if isinstance(result, BaseException):
+                errors.append(result)
+                print(f"\nServer {name} failed to start: {result}")
+            else:
+                self.replicas.setdefault(name, []).append(connection)
+        if not self.replicas:
+            raise RuntimeError("No MCP server could be started") from (errors[0] if errors else None)
+        self._build_routes()
+
+    def _build_routes(self) -> None:
+        namespaced = len(self.replicas) > 1 #a single server keeps its plain tool names
+        self.routes = {}
+        self.tools = []
+        self.retryable = set()
+        for name, connections in self.replicas.items():
+            for tool in connections[0].tools: #every replica runs the same server, so they share one tool list
+                exposed_name = f"{name}{NAMESPACE_SEPARATOR}{tool.name}" if namespaced else tool.name
+                self.routes[exposed_name] = (name, tool.name)
+                self.tools.append(tool.model_copy(update={"name": exposed_name}))
+                if tool.annotations is not None and tool.annotations.readOnlyHint:
+                    self.retryable.add(exposed_name)
+
+    async def refresh_tools(self) -> None:
+        """Re-fetches tool lists for servers that sent notifications/tools/list_changed, then rebuilds the routes"""
+        stale = [connections[0] for connections in self.replicas.values() if any(c.tools_stale for c in connections)]
+        if not stale:
+            return
+        await asyncio.gather(*(connection.refresh_tools() for connection in stale if connection.healthy), return_exceptions=True)
+        for connections in self.replicas.values():
+            for connection in connections:
+                connection.tools_stale = False
+        self._build_routes()
+
+    async def call_tool(self, name: str, arguments: dict[str, Any], meta: Optional[dict[str, Any]] = None) -> types.CallToolResult:
+        """Routes a tool call to the least busy healthy replica of the server that owns the tool
+
+        If the chosen process turns out to have crashed, it's restarted, and read-only tools are retried once on a healthy replica
+
+        Args:
+            name: tool name as claude sees it (namespaced when there are several servers)
+            arguments: tool arguments from claude
+            meta: extra fields for the request's _meta, e.g. {"traceparent": ...} so the server's spans join the query's trace
+        """
+        if name not in self.routes:
+            raise ValueError(f"Unknown tool {name}")
+        server, tool_name = self.routes[name]
+        #built by hand instead of session.call_tool(), which has no way to set _meta
+        request = types.ClientRequest(types.CallToolRequest(
+            method="tools/call",
+            params=types.CallToolRequestParams(name=tool_name, arguments=arguments, _meta=types.RequestParams.Meta(**meta) if meta else None),
+        ))
+        attempts = 2 if name in self.retryable else 1
+        for attempt in range(attempts):
+            connection = await self._pick_replica(server)
+            connection.in_flight += 1
+            try:
+                return await connection.session.send_request(request, types.CallToolResult)
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                connection.healthy = False #crashed mid-call, gets restarted before it's picked again
+                if attempt == attempts - 1:
+                    raise
+            finally:
+                connection.in_flight -= 1
+
+    async def read_trace(self, trace_id: str) -> list[dict]:
+        """Every span any connected server recorded for a trace (replicas each keep their own, so all of them are asked)"""
+        connections = [c for connections in self.replicas.values() for c in connections if c.healthy]
+        results = await asyncio.gather(*(connection.read_trace(trace_id) for connection in connections), return_exceptions=True)
+        return [span for result in results if not isinstance(result, BaseException) for span in result]
+
+    async def _pick_replica(self, server: str) -> ServerConnection:
+        connections = self.replicas[server]
+        healthy = [connection for connection in connections if connection.healthy]
+        if healthy:
+            for connection in connections: #bring crashed replicas back in the background while the healthy ones keep serving
+                if not connection.healthy:
+                    asyncio.create_task(self._restart(connection)).add_done_callback(lambda task: task.exception())
+            return min(healthy, key=lambda connection: connection.in_flight)
+        await self._restart(connections[0]) #nothing healthy left, this call has to wait for a restart
+        return connections[0]
+
+    async def _restart(self, connection: ServerConnection) -> None:
+        lock = self._restart_locks.setdefault(id(connection), asyncio.Lock())
+        async with lock: #several callers can notice the same crash, only restart once
+            if connection.healthy:
+                return
+            print(f"\nRestarting crashed server {connection.config.name}...")
+            await connection.stop()
+            await connection.start()
+
+    async def stop(self) -> None:
+        """Stops every server process"""
+        await asyncio.gather(*(c.stop() for connections in self.replicas.values() for c in connections), return_exceptions=True)
+        self.replicas.clear()
@@ -0,0 +1,99 @@
+#Runs queries through MCPClient against benchmarks/stub_llm.py and a fake tool server, checks what ends up in the history
+import asyncio
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE)) #client.py, conversation.py
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "benchmarks")) #stub_llm.py
+
+from mcp import types
+from stub_llm import StubLLMServer
+
+class FakeServers:
+    """Stands in for ServerManager, answers every tool call with the same text"""
+    def __init__(self, text: str = "{name} result"):
+        self.calls = 0
+        self.text = text
+
+    async def call_tool(self, name, arguments, meta=None):
+        self.calls += 1
+        return types.CallToolResult(content=[types.TextContent(type="text", text=self.text.format(name=name))])
+
+    async def stop(self):
+        pass
+
+def run_queries(queries: list[str], servers=None, read_only=False, tool_result_ttl=0) -> list[dict]:
+    llm = StubLLMServer().start()
+    os.environ.update(ANTHROPIC_BASE_URL=llm.base_url, ANTHROPIC_API_KEY="stub-key")
+    from client import MCPClient
+    from conversation import Conversation
+
+    async def main():
+        client = MCPClient(tool_result_ttl=tool_result_ttl)
+        client.servers = servers or FakeServers()
+        client.available_tools = [{"name": "get_forecast", "description": "forecast", "input_schema": {"type": "object"}}]
+        client.reusable_tools = {"get_forecast"} if read_only else set()
+        conversation = Conversation()
+        for query in queries:
+            await client.process_query(query, conversation)
+        await client.cleanup()
+        return conversation.messages
+
+    try:
+        return asyncio.run(main())
+    finally:
+        llm.stop()
+
+def test_history_alternates_roles_across_queries():
+    messages = run_queries(["What's the forecast at 39.7456, -97.0892?", "And at 39.8456, -96.9892?"])
+    roles = [message["role"] for message in messages]
+    assert roles == ["user", "assistant", "user", "assistant"] * 2
+    assert all(a != b for a, b in zip(roles, roles[1:]))
+    #each query ends on claude's text answer, not on the tool results
+    assert [block.type for block in messages[3]["content"]] == ["text"]
+    assert [block.type for block in messages[-1]["content"]] == ["text"]
+
+SAME_QUESTION = ["What's the forecast at 39.7456, -97.0892?"] * 2
+
+def test_read_only_results_are_reused():
+    servers = FakeServers()
+    run_queries(SAME_QUESTION, servers, read_only=True, tool_result_ttl=60)
+    assert servers.calls == 1
+
+def test_other_tools_and_failures_are_not_reused():
+    servers = FakeServers()
+    run_queries(SAME_QUESTION, servers, read_only=False, tool_result_ttl=60)
+    assert servers.calls == 2
+    servers = FakeServers("Cannot get detailed forecast :(")
+    run_queries(SAME_QUESTION, servers, read_only=True, tool_result_ttl=60)
+    assert servers.calls == 2
+
+def test_concurrent_queries_keep_their_own_usage():
+    llm = StubLLMServer().start()
+    os.environ.update(ANTHROPIC_BASE_URL=llm.base_url, ANTHROPIC_API_KEY="stub-key")
+    from client import MCPClient
+    from conversation import Conversation
+
+    async def main():
+        client = MCPClient(tool_result_ttl=0)
+        client.servers = FakeServers("x" * 2000)
+        client.available_tools = [{"name": "get_forecast", "description": "forecast", "input_schema": {"type": "object"}}]
+        #a long question makes one query's token counts clearly different from the other's
+        conversations = [Conversation(), Conversation()]
+        questions = ["What's the forecast at 39.7456, -97.0892?", "What's the forecast at 39.7456, -97.0892? " + "please " * 400]
+        await asyncio.gather(*(client.process_query(q, c) for q, c in zip(questions, conversations)))
+        await client.cleanup()
+        return client, conversations
+
+    try:
+        client, conversations = asyncio.run(main())
+    finally:
+        llm.stop()
+    queries = [span for span in client.telemetry.spans if span.name == "query"]
+    assert len(queries) == 2
+    for query in queries:
+        calls = [span for span in client.telemetry.trace(query.trace_id) if span.name == "llm.messages"]
+        assert query.attributes["input_tokens"] == sum(span.attributes["input_tokens"] for span in calls)
+    assert sorted(c.usage["input_tokens"] for c in conversations) == sorted(q.attributes["input_tokens"] for q in queries)
+    assert conversations[0].usage["input_tokens"] < conversations[1].usage["input_tokens"]
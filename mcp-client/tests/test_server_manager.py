@@ -0,0 +1,69 @@
+#Starts two replicas of a tiny stdio server whose tools kill their own process, checks which calls get retried
+import asyncio
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE)) #server_manager.py
+
+from mcp import StdioServerParameters
+from server_manager import ServerConfig, ServerManager
+
+#every call crashes the replica it lands on, like a tool that brings its process down
+CRASHING_SERVER = """
+import os
+from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
+
+mcp = FastMCP("crash")
+
+def crash():
+    with open(os.environ["CALLS_FILE"], "a") as f: #one line per call that reached a replica
+        f.write("call\\n")
+    os._exit(1)
+
+@mcp.tool(annotations=ToolAnnotations(readOnlyHint=True))
+def lookup() -> str:
+    crash()
+
+@mcp.tool()
+def update() -> str:
+    crash()
+
+mcp.run()
+"""
+
+def call_replicated(tmp_path, tool: str) -> tuple[int, list[bool]]:
+    """Calls tool once on a 2-replica server, returns how many replicas it reached and which are still healthy afterwards"""
+    script = tmp_path / "crash_server.py"
+    script.write_text(CRASHING_SERVER)
+    calls_file = tmp_path / "calls"
+    calls_file.write_text("")
+    params = StdioServerParameters(command=sys.executable, args=[str(script)], env={**os.environ, "CALLS_FILE": str(calls_file)})
+
+    async def main():
+        servers = ServerManager()
+        await servers.start([ServerConfig("crash", params, replicas=2)])
+        try:
+            with pytest.raises(Exception):
+                await servers.call_tool(tool, {})
+            return [connection.healthy for connection in servers.replicas["crash"]]
+        finally:
+            await servers.stop()
+
+    healthy = asyncio.run(main())
+    return len(calls_file.read_text().splitlines()), healthy
+
+def test_other_tools_are_not_retried_after_a_crash(tmp_path):
+    #the call that crashed one replica isn't sent to the other one, which stays up
+    calls, healthy = call_replicated(tmp_path, "update")
+    assert calls == 1
+    assert sorted(healthy) == [False, True]
+
+def test_read_only_tools_are_retried_once(tmp_path):
+    #the retry lands on the other replica, and both crashed replicas are marked unhealthy so neither is picked again as-is
+    calls, healthy = call_replicated(tmp_path, "lookup")
+    assert calls == 2
+    assert healthy == [False, False]
@@ -0,0 +1,250 @@
+#Lightweight tracing + metrics, no OpenTelemetry SDK needed
+#Shared by weather/ (weather.py) and mcp-client/ (client.py) - both projects depend on this one by path, see their pyproject.toml
+#Spans: timed pieces of work (an LLM call, a tool call, one NWS request) with attributes like status, bytes, tokens
+##every span belongs to a trace - one user query - and the client sends the trace id to the server inside the MCP
+##request's _meta as a W3C "traceparent" string, so the server's spans line up under the client's tool call span
+#Metrics: counters and latency histograms, rendered in the Prometheus text format (what /metrics endpoints serve)
+#Export: finished spans can be appended to a file as OTLP/JSON lines (one {"resourceSpans": ...} object per line,
+##the same format the OpenTelemetry collector's file exporter writes and its otlpjsonfile receiver reads)
+
+import json
+import os
+import secrets
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0) # seconds
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str # 32 hex chars, shared by every span of one query (in every process)
+    span_id: str # 16 hex chars
+    parent_id: str | None # None for the first span of a trace
+    start_ns: int # time.time_ns(), wall clock so spans from different processes line up
+    end_ns: int | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+    service: str = ""
+    local_root: bool = False # no parent in this process (the parent, if any, came from the other side of an MCP call)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def traceparent(self) -> str:
+        """W3C trace context header value naming this span as the parent."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1, # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+    @classmethod
+    def from_otlp(cls, data: dict[str, Any], service: str = "") -> "Span":
+        attributes = {item["key"]: _from_otlp_value(item["value"]) for item in data.get("attributes", [])}
+        status = data.get("status", {})
+        return cls(data["name"], data["traceId"], data["spanId"], data.get("parentSpanId"), int(data["startTimeUnixNano"]),
+                   int(data["endTimeUnixNano"]), attributes, status.get("message") if status.get("code") == 2 else None, service)
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)} # OTLP/JSON sends 64-bit ints as strings
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _from_otlp_value(value: dict[str, Any]) -> Any:
+    if "intValue" in value:
+        return int(value["intValue"])
+    return next(iter(value.values()), None)
+
+
+def parse_traceparent(value: str | None) -> tuple[str, str] | None:
+    """(trace id, parent span id) from a "00-<trace>-<span>-<flags>" string, None if it's missing or malformed."""
+    parts = (value or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def _label_text(labels: tuple[tuple[str, Any], ...], le: str | None = None) -> str:
+    if le is not None:
+        labels = labels + (("le", le),)
+    items = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") # escapes the exposition format requires
+        items.append(f'{key}="{value}"')
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+class Telemetry:
+    """Span recorder + counters/histograms for one process.
+
+    Spans started with span() become the "current" span for the code inside the with block (and any tasks it starts),
+    so nested calls pick up their parent automatically. start_span()/end_span() are for spans that can't be a with
+    block (e.g. across the yields of an async generator) and take their parent explicitly.
+    """
+
+    def __init__(self, service: str, otlp_path: str | None = None, max_spans: int = 5000):
+        self.service = service
+        self.metric_prefix = service.replace("-", "_")
+        self.otlp_path = otlp_path or None
+        self.spans: deque[Span] = deque(maxlen=max_spans) # recent finished spans, for profiles/trace lookups
+        self._pending: list[Span] = [] # finished spans not yet written to otlp_path
+        self._current: ContextVar[Span | None] = ContextVar(f"{service}_current_span", default=None)
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, list]] = {} # name -> labels -> [bucket counts..., sum, count]
+
+    def current(self) -> Span | None:
+        return self._current.get()
+
+    def start_span(self, name: str, parent: "Span | tuple[str, str] | None" = None, **attributes: Any) -> Span:
+        """Start a span under parent (a Span, a (trace id, span id) from parse_traceparent, or None for the current span)."""
+        if parent is None:
+            parent = self._current.get()
+        if isinstance(parent, Span):
+            trace_id, parent_id, local_root = parent.trace_id, parent.span_id, False
+        elif parent is not None:
+            (trace_id, parent_id), local_root = parent, True
+        else:
+            trace_id, parent_id, local_root = secrets.token_hex(16), None, True
+        return Span(name, trace_id, secrets.token_hex(8), parent_id, time.time_ns(), attributes=dict(attributes),
+                    service=self.service, local_root=local_root)
+
+    def end_span(self, span: Span, error: BaseException | str | None = None) -> None:
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = str(error) or type(error).__name__
+        self.spans.append(span)
+        self.observe(f"{self.metric_prefix}_span_duration_seconds", span.duration_ms / 1000, span=span.name)
+        if self.otlp_path:
+            self._pending.append(span)
+            if span.local_root: # a whole query/tool call finished, write its spans as one line
+                self.flush()
+
+    @contextmanager
+    def span(self, name: str, parent: "Span | tuple[str, str] | None" = None, **attributes: Any) -> Iterator[Span]:
+        span = self.start_span(name, parent, **attributes)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self._current.reset(token)
+            self.end_span(span, e)
+            raise
+        self._current.reset(token)
+        self.end_span(span)
+
+    def trace(self, trace_id: str) -> list[Span]:
+        """Finished spans of one trace that are still in memory, oldest first."""
+        return [span for span in self.spans if span.trace_id == trace_id]
+
+    def count(self, name: str, value: float = 1, **labels: Any) -> None:
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+        values = series.setdefault(key, [0] * len(DURATION_BUCKETS) + [0.0, 0])
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+    def prometheus_text(self, gauges: dict[str, float] | None = None) -> str:
+        """Every counter and histogram (plus any point-in-time gauges passed in) in the Prometheus text exposition format."""
+        lines = []
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        for name, series in sorted(self._counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_label_text(labels)} {value:g}" for labels, value in sorted(series.items()))
+        for name, series in sorted(self._histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, values in sorted(series.items()):
+                for bound, count in zip(DURATION_BUCKETS, values):
+                    lines.append(f"{name}_bucket{_label_text(labels, f'{bound:g}')} {count}")
+                lines.append(f"{name}_bucket{_label_text(labels, '+Inf')} {values[-1]}")
+                lines.append(f"{name}_sum{_label_text(labels)} {values[-2]:.6f}")
+                lines.append(f"{name}_count{_label_text(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def otlp(self, spans: list[Span]) -> dict[str, Any]:
+        """Spans wrapped in the OTLP/JSON ExportTraceServiceRequest shape."""
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service}}]},
+            "scopeSpans": [{"scope": {"name": "mcplearn.telemetry"}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+
+    def flush(self) -> None:
+        """Append pending spans to otlp_path as one JSON line (small synchronous write, once per query/tool call)."""
+        if not self.otlp_path or not self._pending:
+            return
+        spans, self._pending = self._pending, []
+        directory = os.path.dirname(os.path.abspath(self.otlp_path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.otlp_path, "a") as f:
+            f.write(json.dumps(self.otlp(spans)) + "\n")
+
+
+def profile_report(spans: list[Span]) -> str:
+    """Indented tree of one trace's spans with durations, offsets from the start and attributes, plus totals per span name."""
+    if not spans:
+        return "(no spans recorded)"
+    ids = {span.span_id for span in spans}
+    children: dict[str | None, list[Span]] = {}
+    for span in spans:
+        children.setdefault(span.parent_id if span.parent_id in ids else None, []).append(span)
+    start = min(span.start_ns for span in spans)
+    services = {span.service for span in spans}
+    lines = [f"trace {spans[0].trace_id}"]
+
+    def walk(parent_id: str | None, depth: int) -> None:
+        for span in sorted(children.get(parent_id, []), key=lambda span: span.start_ns):
+            label = ("  " * depth + span.name)[:48]
+            where = f"[{span.service}] " if len(services) > 1 else ""
+            details = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+            if span.error:
+                details += f" ERROR={span.error}"
+            lines.append(f"  {label:<48} {span.duration_ms:9.1f} ms  @{(span.start_ns - start) / 1e6:8.1f} ms  {where}{details}")
+            walk(span.span_id, depth + 1)
+
+    walk(None, 0)
+    totals: dict[str, list[float]] = {}
+    for span in spans:
+        total = totals.setdefault(span.name.split(" ")[0], [0, 0.0])
+        total[0] += 1
+        total[1] += span.duration_ms
+    lines.append("  totals (parallel spans overlap, so these can add up to more than the query took):")
+    for name, (count, total_ms) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        lines.append(f"    {name:<30} x{count:<4} {total_ms:9.1f} ms")
+    return "\n".join(lines)
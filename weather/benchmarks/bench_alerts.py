@@ -0,0 +1,70 @@
+#Compares fetching a big /alerts payload the old way (whole body -> response.json()) with the streamed projection get_alerts uses now
+#Usage: python benchmarks/bench_alerts.py [--alerts N] [--calls N]
+##"projected" uses the default NWS_ALERT_STREAM_MIN_BYTES threshold, "streamed" forces ijson for every body size
+##runs fully offline against benchmarks/stub_nws.py, reports latency, peak python memory per call and what ends up cached
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) #lets us import weather.py from the parent folder
+
+from stub_nws import StubNWSServer
+
+async def time_calls(fetch, calls: int) -> list[float]:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await fetch()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+async def peak_memory(fetch) -> tuple[int, object]:
+    tracemalloc.start()
+    data = await fetch()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, data
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare full-json and projected (json.loads or streamed) parsing of a big /alerts payload")
+    parser.add_argument("--alerts", type=int, default=300, help="alerts in the stub's reply")
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    stub = StubNWSServer(alert_count=args.alerts).start()
+    os.environ["NWS_API_BASE"] = stub.base_url
+    os.environ["NWS_CACHE_MAX_ENTRIES"] = "0" #every call parses a fresh body
+    os.environ["NWS_RATE_LIMIT"] = "1000000" #the stub doesn't throttle, so don't let the rate limiter add waits to the timings
+    import weather #imported after NWS_API_BASE is set so the module picks up the stub
+    from nws_alerts import AlertProjection, normalize_severities
+    logging.getLogger("httpx").setLevel(logging.WARNING) #FastMCP turns on INFO logging, which would log every request
+
+    url = f"{stub.base_url}/alerts/active/area/CA"
+    modes = {
+        "full json": lambda: weather.make_nws_request(url),
+        "projected": lambda: weather.make_nws_request(url, projection=AlertProjection(None, weather.NWS_ALERT_MAX_CHARS, weather.NWS_ALERT_STREAM_MIN_BYTES)),
+        "proj+severe": lambda: weather.make_nws_request(url, projection=AlertProjection(normalize_severities(["Severe", "Extreme"]), weather.NWS_ALERT_MAX_CHARS, weather.NWS_ALERT_STREAM_MIN_BYTES)),
+        "streamed": lambda: weather.make_nws_request(url, projection=AlertProjection(None, weather.NWS_ALERT_MAX_CHARS, 0)), #ijson whatever the size
+    }
+    try:
+        body_bytes = len(json.dumps(stub.alerts_body).encode())
+        print(f"{args.alerts} alerts, {body_bytes / 1024:.0f} KiB body, {args.calls} calls per mode")
+        for label, fetch in modes.items():
+            await fetch() #warm the connection pool
+            timings = await time_calls(fetch, args.calls)
+            peak, data = await peak_memory(fetch)
+            print(f"{label:<12} p50 {statistics.median(timings):8.2f} ms   mean {statistics.mean(timings):8.2f} ms   "
+                  f"peak mem {peak / 1024:8.0f} KiB   result {len(json.dumps(data)) / 1024:6.0f} KiB, {len(data['features'])} alerts")
+    finally:
+        await weather.close_http_client()
+        stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+#Compares make_nws_request latency with the response cache missing, revalidating (304) and hitting
+#Usage: python benchmarks/bench_cache.py [--calls N]
+##runs fully offline against benchmarks/stub_nws.py
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) #lets us import weather.py from the parent folder
+
+from stub_nws import StubNWSServer
+
+async def time_calls(weather, url: str, calls: int, clear: bool) -> list[float]:
+    timings = []
+    for _ in range(calls):
+        if clear:
+            weather.response_cache.clear()
+        start = time.perf_counter()
+        await weather.make_nws_request(url)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings
+
+def report(label: str, timings: list[float]) -> None:
+    print(f"{label:<14} mean {statistics.mean(timings):9.1f} us   p50 {statistics.median(timings):9.1f} us")
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare make_nws_request latency on cache misses, revalidations and hits")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    fresh_stub = StubNWSServer(max_age=300).start() #responses stay fresh for 5 minutes
+    stale_stub = StubNWSServer(max_age=0).start() #responses must be revalidated every time
+    os.environ["NWS_API_BASE"] = fresh_stub.base_url
+    os.environ["NWS_RATE_LIMIT"] = "1000000" #the stub doesn't throttle, so don't let the rate limiter add waits to the timings
+    import weather #imported after NWS_API_BASE is set so the module picks up the stub
+    logging.getLogger("httpx").setLevel(logging.WARNING) #FastMCP turns on INFO logging, which would log every request
+
+    path = "/gridpoints/STUB/10,20/forecast"
+    try:
+        miss = await time_calls(weather, fresh_stub.base_url + path, args.calls, clear=True)
+        revalidated = await time_calls(weather, stale_stub.base_url + path, args.calls, clear=False)
+        hit = await time_calls(weather, fresh_stub.base_url + path, args.calls, clear=False)
+    finally:
+        await weather.close_http_client()
+        fresh_stub.stop()
+        stale_stub.stop()
+
+    print(f"{args.calls} sequential make_nws_request calls per mode")
+    report("miss", miss)
+    report("revalidate", revalidated)
+    report("hit", hit)
+    print("cache stats:", weather.response_cache.stats())
+
+if __name__ == "__main__":
+    asyncio.run(main())
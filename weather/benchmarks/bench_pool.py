@@ -0,0 +1,64 @@
+#Compares per-call latency of the old "new AsyncClient per request" pattern with the shared connection pool
+#Usage: python benchmarks/bench_pool.py [--calls N] [--connect-delay SECONDS]
+##runs fully offline against benchmarks/stub_nws.py
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) #lets us import weather.py from the parent folder
+
+from stub_nws import StubNWSServer
+
+async def fresh_client_get(url: str) -> None:
+    """What make_nws_request used to do: a brand new client (and connection) for every call."""
+    import httpx
+    async with httpx.AsyncClient() as client:
+        response = await client.get(url, timeout=30.0)
+        response.raise_for_status()
+        response.json()
+
+async def time_calls(fetch, url: str, calls: int) -> list[float]:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await fetch(url)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def report(label: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<14} mean {statistics.mean(timings):7.2f} ms   p50 {statistics.median(timings):7.2f} ms   p95 {p95:7.2f} ms")
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare per-request AsyncClients with the shared connection pool")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--connect-delay", type=float, default=0.005, help="simulated handshake cost per new connection (seconds)")
+    args = parser.parse_args()
+
+    stub = StubNWSServer(connect_delay=args.connect_delay).start()
+    os.environ["NWS_API_BASE"] = stub.base_url
+    os.environ["NWS_CACHE_MAX_ENTRIES"] = "0" #measure the connection pool, not the response cache
+    os.environ["NWS_RATE_LIMIT"] = "1000000" #the stub doesn't throttle, so don't let the rate limiter add waits to the timings
+    import weather #imported after NWS_API_BASE is set so the module picks up the stub
+    logging.getLogger("httpx").setLevel(logging.WARNING) #FastMCP turns on INFO logging, which would log every request
+
+    url = f"{stub.base_url}/gridpoints/STUB/10,20/forecast"
+    try:
+        fresh = await time_calls(fresh_client_get, url, args.calls)
+        pooled = await time_calls(weather.make_nws_request, url, args.calls)
+    finally:
+        await weather.close_http_client()
+        stub.stop()
+
+    print(f"{args.calls} sequential GETs, {args.connect_delay * 1000:.1f} ms simulated handshake per new connection")
+    report("fresh client", fresh)
+    report("pooled client", pooled)
+
+if __name__ == "__main__":
+    asyncio.run(main())
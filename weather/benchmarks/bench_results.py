@@ -0,0 +1,77 @@
+#Shared helpers for the load benchmarks: latency percentiles, memory use, JSON results and regression checks
+##used by load_mcp.py here and mcp-client/benchmarks/bench_client.py
+
+import json
+import math
+import resource
+import sys
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile (pct in 0-100) of a list of numbers, 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def latency_summary(latencies_ms: list[float]) -> dict[str, float]:
+    return {
+        "p50": round(percentile(latencies_ms, 50), 3),
+        "p95": round(percentile(latencies_ms, 95), 3),
+        "p99": round(percentile(latencies_ms, 99), 3),
+        "mean": round(sum(latencies_ms) / len(latencies_ms), 3) if latencies_ms else 0.0,
+        "max": round(max(latencies_ms, default=0.0), 3),
+    }
+
+def max_rss_mb(children: bool = False) -> float:
+    """Peak resident memory of this process, or of its finished child processes (e.g. a server we launched and stopped)."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    per_mb = 1024 * 1024 if sys.platform == "darwin" else 1024 #macOS reports bytes, linux reports KiB
+    return round(usage.ru_maxrss / per_mb, 1)
+
+#Metrics compared against a baseline, and which direction is worse
+REGRESSION_CHECKS = {
+    ("latency_ms", "p50"): "higher",
+    ("latency_ms", "p95"): "higher",
+    ("latency_ms", "p99"): "higher",
+    ("throughput_rps",): "lower",
+    ("error_rate",): "higher",
+}
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Metrics that got worse than the baseline by more than tolerance (0.2 = 20%)."""
+    problems = []
+    for path, worse in REGRESSION_CHECKS.items():
+        current, previous = results, baseline
+        for key in path:
+            current, previous = current.get(key), previous.get(key)
+            if current is None or previous is None:
+                break
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)):
+            continue
+        name = ".".join(path)
+        if worse == "higher" and current > previous * (1 + tolerance) and current - previous > 1e-9:
+            problems.append(f"{name}: {previous} -> {current}")
+        elif worse == "lower" and current < previous * (1 - tolerance):
+            problems.append(f"{name}: {previous} -> {current}")
+    return problems
+
+def write_results(results: dict, path: str | None) -> None:
+    """Print the results as JSON, and also save them to path if one is given."""
+    text = json.dumps(results, indent=2)
+    print(text)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+def check_baseline(results: dict, baseline_path: str | None, tolerance: float) -> int:
+    """Compare against a saved results file, print what regressed, and return an exit code (1 = regressed)."""
+    if not baseline_path:
+        return 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    problems = find_regressions(results, baseline, tolerance)
+    for problem in problems:
+        print(f"REGRESSION {problem}", file=sys.stderr)
+    if not problems:
+        print(f"No regressions against {baseline_path} (tolerance {tolerance:.0%})", file=sys.stderr)
+    return 1 if problems else 0
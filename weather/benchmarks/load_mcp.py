@@ -0,0 +1,188 @@
+#MCP load generator: drives get_forecast/get_alerts on a real weather.py process at a chosen concurrency, fully offline
+#Usage: python benchmarks/load_mcp.py [--transport stdio|streamable-http] [--concurrency 20] [--requests 1000] [--output results.json]
+##starts stub_nws.py (its fixtures, optional latency/error injection), launches weather.py pointed at it,
+##fires tool calls from --concurrency workers and prints p50/p95/p99 latency, throughput, errors and peak RSS as JSON
+##--baseline old_results.json exits with status 1 if latency/throughput/errors got worse by more than --tolerance,
+##so a run before deploying can be compared to the last known good one
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import time
+from contextlib import AsyncExitStack
+
+import httpx
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+
+from bench_results import check_baseline, latency_summary, max_rss_mb, write_results
+from stub_nws import StubNWSServer
+
+WEATHER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "weather.py")
+FAILURE_PREFIXES = ("Cannot get",) #what the tools answer (instead of raising) when NWS couldn't be reached
+
+def parse_mix(value: str) -> dict[str, int]:
+    """"get_forecast=3,get_alerts=1" -> {"get_forecast": 3, "get_alerts": 1} (relative weights)"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+def make_calls(args) -> list[tuple[str, dict]]:
+    """The whole sequence of tool calls up front, so every run with the same seed sends the same traffic."""
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    #locations 0.1 degrees apart round to different gridpoint index keys, so --locations controls how often the cache/index can help
+    locations = [(round(39.7456 + 0.1 * (i // 10), 4), round(-97.0892 + 0.1 * (i % 10), 4)) for i in range(args.locations)]
+    states = [state.strip().upper() for state in args.states.split(",")]
+    calls = []
+    for _ in range(args.warmup + args.requests):
+        tool = rng.choices(list(mix), weights=list(mix.values()))[0]
+        if tool == "get_forecast":
+            latitude, longitude = rng.choice(locations)
+            calls.append((tool, {"latitude": latitude, "longitude": longitude}))
+        else:
+            calls.append((tool, {"state": rng.choice(states)}))
+    return calls
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def open_sessions(args, env: dict[str, str], stack: AsyncExitStack) -> list[ClientSession]:
+    """Launch weather.py and open the MCP session(s) the workers share."""
+    if args.transport == "stdio": #one process, one session, tool calls are multiplexed over it
+        params = StdioServerParameters(command=sys.executable, args=[WEATHER_SCRIPT], env=env)
+        read, write = await stack.enter_async_context(stdio_client(params))
+        session = await stack.enter_async_context(ClientSession(read, write))
+        await session.initialize()
+        return [session]
+
+    port = free_port()
+    process = await asyncio.create_subprocess_exec(sys.executable, WEATHER_SCRIPT, "--transport", args.transport, "--port", str(port),
+                                                   env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    async def stop_server():
+        process.terminate()
+        await process.wait() #reaped, so its peak memory shows up in RUSAGE_CHILDREN
+    stack.push_async_callback(stop_server)
+    async with httpx.AsyncClient() as client: #wait until uvicorn answers /health
+        for _ in range(100):
+            try:
+                if (await client.get(f"http://127.0.0.1:{port}/health")).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError("weather.py did not start")
+    sessions = []
+    for _ in range(args.sessions): #several clients sharing one server process
+        read, write, _ = await stack.enter_async_context(streamablehttp_client(f"http://127.0.0.1:{port}/mcp/"))
+        session = await stack.enter_async_context(ClientSession(read, write))
+        await session.initialize()
+        sessions.append(session)
+    return sessions
+
+async def run_calls(sessions: list[ClientSession], calls: list[tuple[str, dict]], concurrency: int) -> list[tuple[str, float, bool]]:
+    """Run calls from `concurrency` workers, return (tool, latency ms, ok) for each."""
+    results = []
+    next_call = iter(calls)
+
+    async def worker(session: ClientSession) -> None:
+        for tool, arguments in next_call: #workers pull from one shared iterator, so each call runs exactly once
+            start = time.perf_counter()
+            try:
+                result = await session.call_tool(tool, arguments)
+                text = result.content[0].text if result.content else ""
+                ok = not result.isError and not text.startswith(FAILURE_PREFIXES)
+            except Exception:
+                ok = False
+            results.append((tool, (time.perf_counter() - start) * 1000, ok))
+
+    await asyncio.gather(*(worker(session) for session in itertools.islice(itertools.cycle(sessions), concurrency)))
+    return results
+
+async def read_stats(session: ClientSession) -> dict:
+    stats = {}
+    for name, uri in (("cache", "weather://cache/stats"), ("upstream", "weather://upstream/stats")):
+        contents = (await session.read_resource(uri)).contents
+        stats[name] = json.loads(contents[0].text) if contents else None
+    return stats
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline MCP load test for weather.py")
+    parser.add_argument("--transport", choices=["stdio", "streamable-http"], default="stdio")
+    parser.add_argument("--sessions", type=int, default=4, help="MCP sessions to open (streamable-http only)")
+    parser.add_argument("--concurrency", type=int, default=20, help="tool calls in flight at once")
+    parser.add_argument("--requests", type=int, default=500, help="tool calls to time")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed calls first (connects the pool, fills the cache)")
+    parser.add_argument("--mix", default="get_forecast=3,get_alerts=1", help="tool=weight pairs")
+    parser.add_argument("--locations", type=int, default=20, help="distinct forecast locations to spread calls over")
+    parser.add_argument("--states", default="KS,MO,NE,OK,CO", help="states get_alerts picks from")
+    parser.add_argument("--latency", type=float, default=0.02, help="stub NWS seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.01, help="stub NWS extra random seconds per request")
+    parser.add_argument("--connect-delay", type=float, default=0.0, help="stub NWS seconds per new connection")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub NWS requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--max-age", type=int, default=60, help="stub NWS Cache-Control max-age (-1 = no caching headers)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra environment for weather.py, e.g. NWS_CACHE_MAX_ENTRIES=0")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON results here")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    stub = StubNWSServer(connect_delay=args.connect_delay, max_age=None if args.max_age < 0 else args.max_age, fixtures=True,
+                         latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status, seed=args.seed).start()
+    env = dict(os.environ, NWS_API_BASE=stub.base_url, NWS_GRID_INDEX_PATH="", PYTHONUNBUFFERED="1") #in-memory index, so runs don't depend on what's on disk
+    env.update(dict(item.split("=", 1) for item in args.env))
+    calls = make_calls(args)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    try:
+        async with AsyncExitStack() as stack:
+            sessions = await open_sessions(args, env, stack)
+            await run_calls(sessions, calls[:args.warmup], args.concurrency)
+            upstream_before = stub.request_count
+            start = time.perf_counter()
+            timed = await run_calls(sessions, calls[args.warmup:], args.concurrency)
+            elapsed = time.perf_counter() - start
+            upstream_requests = stub.request_count - upstream_before
+            server_stats = await read_stats(sessions[0])
+    finally:
+        stub.stop()
+
+    failures = sum(1 for _, _, ok in timed if not ok)
+    results = {
+        "benchmark": "load_mcp",
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "tolerance")},
+        "calls": len(timed),
+        "errors": failures,
+        "error_rate": round(failures / len(timed), 4) if timed else 0.0,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(timed) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": latency_summary([ms for _, ms, _ in timed]),
+        "per_tool": {
+            tool: latency_summary([ms for name, ms, _ in timed if name == tool])
+            for tool in sorted({name for name, _, _ in timed})
+        },
+        "upstream_requests": upstream_requests,
+        "upstream_errors_injected": stub.error_count,
+        "server": server_stats,
+        "server_max_rss_mb": max_rss_mb(children=True),
+        "client_max_rss_mb": max_rss_mb(),
+    }
+    write_results(results, args.output)
+    return check_baseline(results, args.baseline, args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,39 @@
+#Saves real api.weather.gov replies into benchmarks/fixtures/ so stub_nws.py can replay them offline
+#Usage: python benchmarks/record_fixtures.py [--latitude 39.7456 --longitude -97.0892 --state KS]
+##records /points/{lat},{lon}, the forecast url it points to, and /alerts/active/area/{state}
+##run it to replace the checked-in fixtures (see stub_nws.py) with real replies
+##(a busy day's alerts file can be several MB, which makes the alert numbers much heavier than the default fixture)
+
+import argparse
+import json
+import os
+
+import httpx
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+API_BASE = "https://api.weather.gov"
+HEADERS = {"User-Agent": "weather-app/1.0", "Accept": "application/geo+json"} #same headers weather.py sends
+
+def save(name: str, body: dict) -> None:
+    path = os.path.join(FIXTURES_DIR, name)
+    with open(path, "w") as f:
+        json.dump(body, f, indent=4)
+        f.write("\n")
+    print(f"wrote {path} ({os.path.getsize(path)} bytes)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Save real api.weather.gov replies into benchmarks/fixtures/")
+    parser.add_argument("--latitude", type=float, default=39.7456)
+    parser.add_argument("--longitude", type=float, default=-97.0892)
+    parser.add_argument("--state", default="KS")
+    args = parser.parse_args()
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with httpx.Client(headers=HEADERS, timeout=30, follow_redirects=True) as client:
+        points = client.get(f"{API_BASE}/points/{args.latitude:.4f},{args.longitude:.4f}").raise_for_status().json()
+        save("points.json", points)
+        save("forecast.json", client.get(points["properties"]["forecast"]).raise_for_status().json())
+        save("alerts.json", client.get(f"{API_BASE}/alerts/active/area/{args.state}").raise_for_status().json())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#Tiny local stand-in for api.weather.gov so benchmarks can run without the network (and without hammering the real api)
+#Serves canned /points, /gridpoints/.../forecast and /alerts/active/area responses over HTTP/1.1 keep-alive
+##connect_delay is slept once per NEW connection, which models the TCP + TLS handshake cost a real https call pays
+##so reusing pooled connections shows up in the numbers the same way it does against the real api
+##max_age turns on Cache-Control/ETag headers and 304 replies, like the real api sends
+##alert_count swaps the one-alert reply for a big realistic one (polygons, zone lists, geocodes, long texts) to stress alert parsing
+##fixtures=True replays the hand-built, schema-matched replies in benchmarks/fixtures/ instead of the tiny built-in ones
+##(record_fixtures.py can replace them with real api.weather.gov replies)
+##latency/jitter are slept on every request (models the api's server time), error_rate answers that fraction of requests
+##with error_status instead (503 by default, 429 to exercise the rate limiter) so retry paths show up in the numbers
+#Run it on its own with: python benchmarks/stub_nws.py --port 8081 --fixtures --latency 0.05 --error-rate 0.01
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+RECORDED_API_BASE = "https://api.weather.gov" #urls inside fixture replies are rewritten to point back at the stub
+
+POINTS_BODY = {
+    "properties": {
+        "gridId": "STUB",
+        "gridX": 10,
+        "gridY": 20,
+        "forecast": "{base}/gridpoints/STUB/10,20/forecast",
+    }
+}
+
+FORECAST_BODY = {
+    "properties": {
+        "periods": [
+            {
+                "name": f"Period {i}",
+                "temperature": 60 + i,
+                "temperatureUnit": "F",
+                "windSpeed": "5 mph",
+                "windDirection": "NW",
+                "detailedForecast": "Sunny, with a high near 60.",
+            }
+            for i in range(14)
+        ]
+    }
+}
+
+ALERTS_BODY = {
+    "features": [
+        {
+            "properties": {
+                "event": "Wind Advisory",
+                "areaDesc": "Stub County",
+                "severity": "Moderate",
+                "description": "Gusty winds expected.",
+                "instruction": "Secure loose objects.",
+            }
+        }
+    ]
+}
+
+SEVERITY_CYCLE = ["Extreme", "Severe", "Moderate", "Minor", "Unknown"]
+
+def make_alerts_body(count: int) -> dict:
+    """An /alerts reply shaped like a busy day in a big state: most of the bytes are fields get_alerts never shows."""
+    features = []
+    for i in range(count):
+        features.append({
+            "id": f"https://api.weather.gov/alerts/urn:oid:stub.{i}",
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[[-120.0 + j * 0.01, 35.0 + j * 0.01] for j in range(200)]]},
+            "properties": {
+                "@id": f"https://api.weather.gov/alerts/urn:oid:stub.{i}",
+                "areaDesc": "; ".join(f"Stub County {j}" for j in range(12)),
+                "geocode": {"SAME": [f"{6000 + j:06d}" for j in range(40)], "UGC": [f"CAZ{j:03d}" for j in range(40)]},
+                "affectedZones": [f"https://api.weather.gov/zones/forecast/CAZ{j:03d}" for j in range(40)],
+                "references": [],
+                "sent": "2024-01-01T00:00:00-08:00",
+                "severity": SEVERITY_CYCLE[i % len(SEVERITY_CYCLE)],
+                "event": "Wind Advisory" if i % 2 else "Flood Warning",
+                "headline": f"Stub alert {i}",
+                "description": "Gusty winds expected across the area. " * 60,
+                "instruction": "Secure loose objects and use extra caution when driving. " * 10,
+                "parameters": {"VTEC": [f"/O.NEW.KSTO.WI.Y.{i:04d}.240101T0000Z-240102T0000Z/"], "NWSheadline": ["WIND ADVISORY"]},
+            },
+        })
+    return {"type": "FeatureCollection", "features": features, "title": "Current watches, warnings, and advisories"}
+
+class StubNWSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" #keeps the socket open between requests so clients can reuse it
+    disable_nagle_algorithm = True #headers and body go out as separate writes, without this kept-alive sockets stall ~40ms on delayed ACKs
+
+    def setup(self):
+        super().setup()
+        if self.server.connect_delay: #runs once per accepted connection, not once per request
+            time.sleep(self.server.connect_delay)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            delay = server.latency + (server.random.uniform(0, server.jitter) if server.jitter else 0)
+            failed = server.error_rate > 0 and server.random.random() < server.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            with server.lock:
+                server.error_count += 1
+            self.send_response(server.error_status)
+            if server.error_status == 429:
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/points/"):
+            payload, etag = server.payloads["points"]
+        elif self.path.startswith("/gridpoints/"):
+            payload, etag = server.payloads["forecast"]
+        elif self.path.startswith("/alerts/active/area/"):
+            payload, etag = server.payloads["alerts"]
+        else:
+            self.send_error(404)
+            return
+        if server.max_age is not None and self.headers.get("If-None-Match") == etag:
+            self.send_response(304) #client's copy is still current, no body
+            self.send_cache_headers(etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/geo+json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_cache_headers(etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_cache_headers(self, etag: str) -> None:
+        if self.server.max_age is not None: #only advertise caching when asked, so other benchmarks measure the network path
+            self.send_header("Cache-Control", f"public, max-age={self.server.max_age}")
+            self.send_header("ETag", etag)
+
+    def log_message(self, format, *args): #keeps benchmark output clean
+        pass
+
+class StubNWSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, connect_delay: float = 0.0, max_age: int | None = None,
+                 alert_count: int | None = None, fixtures: bool = False, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, seed: int | None = None):
+        super().__init__((host, port), StubNWSHandler)
+        self.connect_delay = connect_delay
+        self.max_age = max_age #None = no Cache-Control/ETag headers, otherwise max-age seconds (0 = always revalidate)
+        self.latency = latency #seconds slept before every reply
+        self.jitter = jitter #up to this many extra seconds, picked at random per request
+        self.error_rate = error_rate #fraction of requests (0-1) answered with error_status
+        self.error_status = error_status
+        self.random = random.Random(seed) #seeded so runs with errors/jitter are repeatable
+        self.base_url = f"http://{host}:{self.server_address[1]}"
+        self.request_count = 0 #lets benchmarks check how many upstream calls actually happened
+        self.error_count = 0
+        self.lock = threading.Lock()
+        if fixtures:
+            bodies = {name: self._load_fixture(name) for name in ("points", "forecast", "alerts")}
+        else:
+            bodies = {
+                "points": json.dumps(POINTS_BODY).replace("{base}", self.base_url),
+                "forecast": json.dumps(FORECAST_BODY),
+                "alerts": json.dumps(ALERTS_BODY),
+            }
+        if alert_count is not None:
+            bodies["alerts"] = json.dumps(make_alerts_body(alert_count))
+        self.alerts_body = json.loads(bodies["alerts"])
+        #encoded once up front, so the stub's own json work doesn't end up in the numbers
+        self.payloads = {name: (body.encode(), f'"{hashlib.md5(body.encode()).hexdigest()}"') for name, body in bodies.items()}
+
+    def _load_fixture(self, name: str) -> str:
+        with open(os.path.join(FIXTURES_DIR, f"{name}.json")) as f:
+            return f.read().replace(RECORDED_API_BASE, self.base_url)
+
+    def start(self) -> "StubNWSServer":
+        """Serve on a daemon thread and return self so callers can read base_url."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for api.weather.gov (point weather.py at it with NWS_API_BASE)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--fixtures", action="store_true", help="replay benchmarks/fixtures/*.json")
+    parser.add_argument("--alert-count", type=int, default=None, help="serve this many generated alerts instead")
+    parser.add_argument("--max-age", type=int, default=None, help="send Cache-Control max-age + ETag")
+    parser.add_argument("--connect-delay", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    stub = StubNWSServer(args.host, args.port, args.connect_delay, args.max_age, args.alert_count, args.fixtures,
+                         args.latency, args.jitter, args.error_rate, args.error_status, args.seed)
+    print(f"Serving stub NWS api at {stub.base_url} (Ctrl+C to stop)")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server_close()
@@ -0,0 +1,114 @@
+#Persistent lat/lon -> NWS gridpoint index (used by get_forecast in weather.py)
+#Every forecast used to start with a /points/{lat},{lon} call just to learn which forecast office + grid cell covers
+#that location. That mapping almost never changes, so we remember it in a small SQLite file that survives restarts
+##warm lookups go straight to /gridpoints/{office}/{x},{y}/forecast - one upstream call instead of two
+##coordinates are rounded before lookup so nearby points share a row (2 decimals is ~1.1 km, under half of the
+##2.5 km NWS grid spacing). Near a cell edge that can pick the neighbouring cell, raise precision to 4 for exact /points matches
+##if the file can't be opened or written (read-only disk, bad path), the error is logged and the index carries on in memory only
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GridPoint:
+    grid_id: str # forecast office, e.g. "FFC"
+    grid_x: int
+    grid_y: int
+    updated_at: float # time.time() when /points last confirmed this mapping
+
+    def forecast_url(self, api_base: str) -> str:
+        return f"{api_base}/gridpoints/{self.grid_id}/{self.grid_x},{self.grid_y}/forecast"
+
+
+class GridPointIndex:
+    """In-memory dict of rounded coordinates -> GridPoint, backed by an optional SQLite file.
+
+    Lookups only touch the dict. SQLite reads/writes run in a worker thread so they never block the event loop.
+    """
+
+    def __init__(self, path: str | None, precision: int = 2, max_age: float = 7 * 24 * 3600):
+        self.path = path or None # None/"" keeps the index in memory only
+        self.precision = precision
+        self.max_age = max_age # seconds before an entry is refreshed from /points in the background
+        self._points: dict[tuple[float, float], GridPoint] = {}
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock() # sqlite connections aren't safe to use from two threads at once
+
+    def key(self, latitude: float, longitude: float) -> tuple[float, float]:
+        return (round(latitude, self.precision), round(longitude, self.precision))
+
+    def get(self, latitude: float, longitude: float) -> GridPoint | None:
+        return self._points.get(self.key(latitude, longitude))
+
+    def is_stale(self, point: GridPoint) -> bool:
+        return time.time() - point.updated_at > self.max_age
+
+    async def load(self) -> None:
+        """Open the SQLite file and pull every saved row into memory (called in the background at startup)."""
+        if self.path is None:
+            return
+        try:
+            rows = await asyncio.to_thread(self._load_rows)
+        except (OSError, sqlite3.Error) as e:
+            self._disable_disk(e)
+            return
+        for latitude, longitude, grid_id, grid_x, grid_y, updated_at in rows:
+            # setdefault: anything looked up while we were loading is newer than what's on disk
+            self._points.setdefault((latitude, longitude), GridPoint(grid_id, grid_x, grid_y, updated_at))
+
+    async def put(self, latitude: float, longitude: float, point: GridPoint) -> None:
+        key = self.key(latitude, longitude)
+        self._points[key] = point
+        if self.path is not None:
+            try:
+                await asyncio.to_thread(self._write_row, key, point)
+            except (OSError, sqlite3.Error) as e:
+                self._disable_disk(e)
+
+    def _disable_disk(self, error: Exception) -> None:
+        # a broken index file shouldn't fail forecasts - keep going with just the in-memory dict
+        logger.warning("Gridpoint index file %s is unusable (%s), keeping the index in memory only", self.path, error)
+        self.path = None
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # only called with self._lock held
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS gridpoints ("
+                " latitude REAL, longitude REAL, grid_id TEXT, grid_x INTEGER, grid_y INTEGER, updated_at REAL,"
+                " PRIMARY KEY (latitude, longitude))"
+            )
+            self._db.commit()
+        return self._db
+
+    def _load_rows(self) -> list[tuple]:
+        with self._lock:
+            return self._connect().execute(
+                "SELECT latitude, longitude, grid_id, grid_x, grid_y, updated_at FROM gridpoints"
+            ).fetchall()
+
+    def _write_row(self, key: tuple[float, float], point: GridPoint) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO gridpoints VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, point.grid_id, point.grid_x, point.grid_y, point.updated_at),
+            )
+            db.commit()
@@ -0,0 +1,116 @@
+#Streaming, projected parsing of /alerts responses (used by get_alerts in weather.py)
+#A busy state's alert payload can be several MB of GeoJSON - polygons, zone url lists, geocodes, VTEC parameters - and
+#format_alert only ever shows five fields of it, so each alert is cut down to event/areaDesc/severity/description/instruction
+##long description/instruction texts are cut to max_chars, a severity filter drops non-matching alerts
+#What gets cached (and shared by single-flight callers) is this small projected result, not the full parsed body
+#How the body gets parsed depends on its size:
+##below stream_min_bytes (1 MiB by default): the body is read into one buffer, decoded and parsed with json.loads, then
+##projected - fastest on CPU. The raw bytes are freed before json.loads runs, so this still peaks below response.json()
+##from stream_min_bytes up: the rest is fed to ijson's C parser as it comes off the socket, which only builds python
+##objects for each alert's properties (geometry never becomes python objects), so memory stays flat however big the body is
+#Measured with benchmarks/bench_alerts.py, default settings vs the old response.json():
+##580 KiB / 60 alerts (json.loads path): peak 3.2 MiB vs 3.6 MiB, same ~10 ms per call (ijson would take ~28 ms)
+##2.9 MB / 300 alerts (streamed past the first MiB): peak 3.1 MiB vs 18.2 MiB, ~105-115 ms vs ~100 ms per call -
+##ijson costs more CPU per byte than json.loads, so the win on big bodies is memory (and cache size), not CPU
+#Without ijson installed every body goes through json.loads (same result)
+
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+try:
+    import ijson # incremental JSON parser, uses its C backend when one is available
+except ImportError:
+    ijson = None
+
+ALERT_FIELDS = ("event", "areaDesc", "severity", "description", "instruction") # the properties format_alert renders
+SEVERITIES = ("Extreme", "Severe", "Moderate", "Minor", "Unknown") # CAP severity values NWS uses
+
+_PROPERTIES = "features.item.properties" # ijson prefix of each alert's properties object
+
+
+def normalize_severities(severities: list[str] | None) -> frozenset[str] | None:
+    """Turn user input like ["severe", " EXTREME "] into {"Severe", "Extreme"}, None/empty means no filter."""
+    if not severities:
+        return None
+    return frozenset(severity.strip().capitalize() for severity in severities if severity.strip()) or None
+
+
+class AlertProjection:
+    """Parses an alerts body down to {"features": [{"properties": {five fields}}, ...]} (the shape format_alert expects)."""
+
+    def __init__(self, severities: frozenset[str] | None = None, max_chars: int = 0, stream_min_bytes: int = 1024 * 1024):
+        self.severities = severities # keep only alerts with these severities (None keeps everything)
+        self.max_chars = max_chars # longest description/instruction kept, 0 = no limit
+        self.stream_min_bytes = stream_min_bytes # bodies at least this big are parsed incrementally, see the top of this file
+
+    @property
+    def cache_tag(self) -> str:
+        # different filters/limits give different results for the same url, so each gets its own cache entry
+        return f"alerts:{','.join(sorted(self.severities or ()))}:{self.max_chars}"
+
+    async def parse(self, chunks: AsyncIterator[bytes]) -> tuple[dict[str, Any], int]:
+        """Consume the body chunks, return (projected data, approximate size in bytes for the cache budget)."""
+        body = bytearray() # one growing buffer, not a list of chunks that gets joined into a second full copy
+        async for chunk in chunks:
+            body += chunk
+            if ijson is not None and len(body) >= self.stream_min_bytes:
+                return await self._parse_stream(body, chunks)
+        text = body.decode() # JSON on the wire is UTF-8
+        body.clear() # the raw bytes are gone before json.loads builds the document, only the text is held alongside it
+        return self.project(json.loads(text))
+
+    async def _parse_stream(self, body: bytearray, chunks: AsyncIterator[bytes]) -> tuple[dict[str, Any], int]:
+        found = ijson.sendable_list()
+        parser = ijson.items_coro(found, _PROPERTIES, use_float=True) # push parser: we send() bytes in, finished properties dicts come out
+        ##use_float skips building a Decimal for every (ignored) polygon coordinate
+        features, size, seen = [], 0, 0
+
+        def take() -> None:
+            nonlocal size, seen
+            for props in found:
+                seen += 1
+                kept = self._keep(props)
+                if kept is not None:
+                    features.append({"properties": kept})
+                    size += sum(len(value) for value in kept.values())
+            del found[:] # already handled, don't let them build up
+
+        parser.send(body) # what arrived before the threshold was reached
+        body.clear()
+        take()
+        async for chunk in chunks:
+            parser.send(chunk)
+            take()
+        parser.close() # raises if the body was cut off mid-document
+        take()
+        #a body this big without a single alert in it isn't an alerts collection (an empty one is a few hundred bytes)
+        return ({"features": features} if seen else {}), size
+
+    def project(self, document: Any) -> tuple[dict[str, Any], int]:
+        """Same projection applied to an already parsed document (bodies below stream_min_bytes, or no ijson)."""
+        if not isinstance(document, dict) or not isinstance(document.get("features"), list):
+            return {}, 0
+        features, size = [], 0
+        for feature in document["features"]:
+            kept = self._keep((feature.get("properties") or {}) if isinstance(feature, dict) else {})
+            if kept is not None:
+                features.append({"properties": kept})
+                size += sum(len(value) for value in kept.values())
+        return {"features": features}, size
+
+    def _keep(self, props: Any) -> dict[str, str] | None:
+        #the fields format_alert shows, clipped - None if the severity filter drops this alert
+        if not isinstance(props, dict):
+            props = {}
+        kept = {name: self._clip(props[name]) for name in ALERT_FIELDS if isinstance(props.get(name), str)}
+        return kept if self._wanted(kept) else None
+
+    def _wanted(self, props: dict[str, str]) -> bool:
+        return self.severities is None or props.get("severity", "Unknown") in self.severities
+
+    def _clip(self, text: str) -> str:
+        if self.max_chars > 0 and len(text) > self.max_chars:
+            return text[:self.max_chars].rstrip() + " ...[truncated]"
+        return text
+
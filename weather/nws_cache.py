@@ -0,0 +1,162 @@
+#In-memory HTTP response cache for NWS api calls (used by make_nws_request in weather.py)
+#Follows the same rules a browser cache does:
+##Cache-Control max-age / Expires say how long a response is "fresh" - fresh entries are returned without touching the network
+##ETag / Last-Modified let us ask "has this changed?" once an entry goes stale - a 304 Not Modified reply means we reuse
+##the body we already parsed instead of re-downloading and re-parsing it
+#Many users asking about the same state or grid cell within seconds all get served from here
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import httpx
+
+
+@dataclass
+class CacheEntry:
+    data: Any # parsed JSON body (or the projected part of it, see nws_alerts.py), handed back to callers as-is
+    size: int # body size in bytes, counted against the cache's byte budget
+    expires_at: float # time.monotonic() value after which the entry is stale
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+def _parse_cache_control(value: str) -> dict[str, str | None]:
+    """Split a Cache-Control header into {directive: value} (value is None for bare flags like no-cache)."""
+    directives: dict[str, str | None] = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+def freshness_lifetime(response: httpx.Response) -> float | None:
+    """How many more seconds the response stays fresh, or None if it must not be stored at all.
+
+    Uses max-age (or s-maxage) from Cache-Control first, then Expires - Date, minus any Age the
+    response already spent in an upstream cache. no-cache gives 0 (store, but always revalidate).
+    """
+    directives = _parse_cache_control(response.headers.get("Cache-Control", ""))
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+
+    lifetime = None
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name):
+            try:
+                lifetime = float(directives[name])
+                break
+            except ValueError:
+                pass
+    if lifetime is None and "Expires" in response.headers:
+        try:
+            expires = parsedate_to_datetime(response.headers["Expires"])
+            date = parsedate_to_datetime(response.headers["Date"]) if "Date" in response.headers else None
+            lifetime = expires.timestamp() - (date.timestamp() if date else time.time())
+        except (TypeError, ValueError):
+            lifetime = 0.0 # an invalid Expires means "already expired"
+    if lifetime is None:
+        return 0.0
+
+    try:
+        age = float(response.headers.get("Age", 0))
+    except ValueError:
+        age = 0.0
+    return max(0.0, lifetime - age)
+
+
+class ResponseCache:
+    """LRU cache of parsed NWS responses bounded by entry count and total body bytes."""
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict() # oldest (least recently used) first
+        self._bytes = 0
+        self.hits = 0 # served fresh from memory, no network
+        self.misses = 0 # nothing usable cached, full download
+        self.revalidations = 0 # stale entry confirmed unchanged by a 304
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def lookup(self, url: str) -> CacheEntry | None:
+        """Return the entry for url (fresh or stale) and mark it as recently used."""
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def conditional_headers(self, entry: CacheEntry | None) -> dict[str, str]:
+        """Validators to send so the server can answer 304 instead of the full body."""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, url: str, response: httpx.Response, data: Any, size: int | None = None) -> None:
+        """Cache a 200 response if its headers allow it and it fits in the byte budget.
+
+        size defaults to the raw body length, streamed responses (whose body was never kept) pass their own.
+        """
+        if not self.enabled:
+            return
+        lifetime = freshness_lifetime(response)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        # an entry that is never fresh and can't be revalidated would never be used, so skip it
+        if lifetime is None or (lifetime == 0 and not (etag or last_modified)):
+            self.discard(url)
+            return
+        if size is None:
+            size = len(response.content)
+        if size > self.max_bytes:
+            self.discard(url)
+            return
+
+        self.discard(url)
+        self._entries[url] = CacheEntry(data, size, time.monotonic() + lifetime, etag, last_modified)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def refresh(self, url: str, entry: CacheEntry, response: httpx.Response) -> None:
+        """Apply a 304 Not Modified: keep the cached body, take the new freshness/validators."""
+        lifetime = freshness_lifetime(response)
+        if lifetime is None:
+            self.discard(url)
+            return
+        entry.expires_at = time.monotonic() + lifetime
+        entry.etag = response.headers.get("ETag", entry.etag)
+        entry.last_modified = response.headers.get("Last-Modified", entry.last_modified)
+
+    def discard(self, url: str) -> None:
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
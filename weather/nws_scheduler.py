@@ -0,0 +1,146 @@
+#Client-side traffic control for every NWS api call (used by make_nws_request in weather.py)
+#When we push load, api.weather.gov answers 429 Too Many Requests / 5xx - this keeps us under its limit instead of tripping it:
+##token bucket: requests spend a token, tokens refill at `rate` per second, up to `burst` saved up
+##adaptive rate: a 429 halves the rate, every success nudges it back up toward the configured maximum (AIMD, like TCP)
+##Retry-After: when NWS says "wait N seconds", every queued request waits, not just the one that got told
+##priority queue: when requests have to wait, lower numbers go first (alerts ahead of forecasts ahead of background refreshes)
+##rate <= 0 turns the token bucket off (no client-side limit), Retry-After pauses and priorities still apply
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+PRIORITY_ALERTS = 0 # safety information, always first in line
+PRIORITY_FORECAST = 1
+PRIORITY_BACKGROUND = 2 # index refreshes etc., nobody is waiting on these
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header, which is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamScheduler:
+    """Token bucket + priority queue in front of the NWS api, with adaptive rate and retry backoff helpers."""
+
+    def __init__(self, rate: float = 10.0, burst: int = 10, min_rate: float = 0.5,
+                 retry_base_delay: float = 0.5, retry_max_delay: float = 30.0):
+        self.limited = rate > 0 # False = no token bucket, see the note at the top
+        self.max_rate = rate # requests per second we allow when NWS is happy
+        self.rate = rate # current (possibly reduced) rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = max(1, burst)
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0 # monotonic time before which nothing is sent (set from Retry-After)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = [] # heap of (priority, arrival order, future)
+        self._order = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+        # metrics
+        self.requests = 0
+        self.throttled = 0 # 429 responses seen
+        self.retries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def acquire(self, priority: int = PRIORITY_FORECAST) -> None:
+        """Wait until this request may be sent (a token is free, no Retry-After pause, nobody more important waiting)."""
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future # if the caller is cancelled, the dispatcher just skips this future
+        waited = time.monotonic() - start
+        self.requests += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    async def _dispatch(self) -> None:
+        # a crashed (or cancelled) dispatcher must not leave its waiters hanging forever - they get the error instead,
+        # and the next acquire() starts a fresh dispatcher
+        try:
+            await self._hand_out_tokens()
+        except Exception as e:
+            logger.exception("NWS request scheduler failed")
+            self._fail_waiters(e)
+        except BaseException:
+            self._fail_waiters(RuntimeError("NWS request scheduler stopped"))
+            raise
+
+    def _fail_waiters(self, error: Exception) -> None:
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_exception(error)
+
+    async def _hand_out_tokens(self) -> None:
+        #hands out tokens to waiters in priority order, sleeping whenever the bucket is empty or we're paused
+        while self._waiters:
+            if self._waiters[0][2].done(): # cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+            elif not self.limited:
+                heapq.heappop(self._waiters)[2].set_result(None)
+            elif self._tokens >= 1:
+                self._tokens -= 1
+                heapq.heappop(self._waiters)[2].set_result(None)
+            else:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_success(self) -> None:
+        """Additive increase: creep back toward the configured rate after being throttled."""
+        if self.limited:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.02)
+
+    def on_throttled(self, retry_after: float | None) -> None:
+        """Multiplicative decrease on 429, and pause everyone if NWS told us how long to wait."""
+        self.throttled += 1
+        if self.limited:
+            self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after:
+            self.pause(retry_after)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def backoff_delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """Seconds to wait before retry number `attempt` (0-based): Retry-After if given, else exponential backoff with full jitter."""
+        if retry_after is not None:
+            return min(retry_after, self.retry_max_delay)
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queue_depth": sum(1 for _, _, future in self._waiters if not future.done()),
+            "rate": round(self.rate, 3),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "avg_wait_ms": round(self.total_wait / self.requests * 1000, 3) if self.requests else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
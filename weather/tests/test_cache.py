@@ -0,0 +1,125 @@
+#Feeds plain httpx.Response objects to nws_cache.py, checks the freshness rules and what gets stored, refreshed and evicted
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE)) #nws_cache.py
+
+from nws_cache import ResponseCache, freshness_lifetime
+
+URL = "https://api.weather.gov/gridpoints/TOP/31,80/forecast"
+
+def response(status: int = 200, body: bytes = b"{}", **headers: str) -> httpx.Response:
+    """headers as keyword arguments, _ for - (cache_control="max-age=60" -> Cache-Control: max-age=60)"""
+    return httpx.Response(status, content=body, headers={name.replace("_", "-"): value for name, value in headers.items()})
+
+def http_date(seconds_from_now: float) -> str:
+    return format_datetime(datetime.now(timezone.utc) + timedelta(seconds=seconds_from_now), usegmt=True)
+
+@pytest.mark.parametrize("headers, lifetime", [
+    ({"cache_control": "max-age=60"}, 60),
+    ({"cache_control": "public, s-maxage=120, max-age=60"}, 120), #s-maxage wins, this cache is shared by every caller
+    ({"cache_control": "max-age=60", "age": "45"}, 15), #already spent 45 s in an upstream cache
+    ({"cache_control": "max-age=60", "age": "90"}, 0),
+    ({"cache_control": 'max-age="30"'}, 30),
+    ({"cache_control": "max-age=soon"}, 0),
+    ({}, 0), #no freshness information at all
+])
+def test_cache_control_lifetime(headers, lifetime):
+    assert freshness_lifetime(response(**headers)) == lifetime
+
+def test_expires_is_measured_from_date():
+    #Expires - Date, so a server clock that's off doesn't matter
+    date = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+    headers = {"date": format_datetime(date, usegmt=True), "expires": format_datetime(date + timedelta(seconds=300), usegmt=True)}
+    assert freshness_lifetime(response(**headers)) == 300
+    assert freshness_lifetime(response(**headers, age="100")) == 200
+    #max-age takes precedence over Expires
+    assert freshness_lifetime(response(**headers, cache_control="max-age=10")) == 10
+
+def test_expires_without_date_uses_our_clock():
+    assert 58 <= freshness_lifetime(response(expires=http_date(60))) <= 60
+    assert freshness_lifetime(response(expires="0")) == 0 #invalid Expires means already expired
+
+@pytest.mark.parametrize("cache_control", ["no-store", "private, max-age=60", "max-age=60, no-store"])
+def test_not_stored(cache_control):
+    assert freshness_lifetime(response(cache_control=cache_control)) is None
+    cache = ResponseCache()
+    cache.store(URL, response(cache_control=cache_control, etag='"v1"'), {"v": 1})
+    assert cache.lookup(URL) is None
+
+def test_no_cache_is_stored_only_with_validators():
+    cache = ResponseCache()
+    cache.store(URL, response(cache_control="no-cache"), {"v": 1})
+    assert cache.lookup(URL) is None #never fresh and can't be revalidated, useless
+    cache.store(URL, response(cache_control="no-cache", etag='"v1"'), {"v": 1})
+    entry = cache.lookup(URL)
+    assert entry is not None and not entry.is_fresh()
+    assert cache.conditional_headers(entry) == {"If-None-Match": '"v1"'}
+
+def test_stale_entry_sends_both_validators():
+    cache = ResponseCache()
+    cache.store(URL, response(etag='"v1"', last_modified="Sat, 17 Oct 2026 12:00:00 GMT"), {"v": 1})
+    assert cache.conditional_headers(cache.lookup(URL)) == {"If-None-Match": '"v1"', "If-Modified-Since": "Sat, 17 Oct 2026 12:00:00 GMT"}
+    assert cache.conditional_headers(None) == {}
+
+def test_refresh_on_304_keeps_the_body():
+    cache = ResponseCache()
+    cache.store(URL, response(cache_control="max-age=0", etag='"v1"'), {"v": 1})
+    entry = cache.lookup(URL)
+    assert not entry.is_fresh()
+    cache.refresh(URL, entry, response(304, b"", cache_control="max-age=60", etag='"v2"'))
+    entry = cache.lookup(URL)
+    assert entry.is_fresh() and entry.data == {"v": 1}
+    assert entry.etag == '"v2"'
+    assert 59 <= entry.expires_at - time.monotonic() <= 60
+    #a 304 that says no-store drops the entry
+    cache.refresh(URL, entry, response(304, b"", cache_control="no-store"))
+    assert cache.lookup(URL) is None
+
+def test_refresh_keeps_validators_the_304_leaves_out():
+    cache = ResponseCache()
+    cache.store(URL, response(cache_control="max-age=0", etag='"v1"', last_modified="Sat, 17 Oct 2026 12:00:00 GMT"), {"v": 1})
+    entry = cache.lookup(URL)
+    cache.refresh(URL, entry, response(304, b"", cache_control="max-age=60"))
+    assert (entry.etag, entry.last_modified) == ('"v1"', "Sat, 17 Oct 2026 12:00:00 GMT")
+
+def test_byte_budget_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=10, max_bytes=250)
+    for name in "abc":
+        cache.store(name, response(body=b"x" * 100, cache_control="max-age=60"), name)
+    #a + b + c is 300 bytes, so a (oldest) went
+    assert cache.lookup("a") is None
+    assert cache.stats()["bytes"] == 200
+    cache.lookup("b") #b is now the most recently used, so c goes next
+    cache.store("d", response(body=b"x" * 100, cache_control="max-age=60"), "d")
+    assert [url for url in "abcd" if cache.lookup(url)] == ["b", "d"]
+    assert cache.stats()["bytes"] == 200
+
+def test_entry_count_limit_and_oversized_bodies():
+    cache = ResponseCache(max_entries=2, max_bytes=1000)
+    for name in "abc":
+        cache.store(name, response(cache_control="max-age=60"), name)
+    assert [url for url in "abc" if cache.lookup(url)] == ["b", "c"]
+    cache.store("big", response(body=b"x" * 2000, cache_control="max-age=60"), "big")
+    assert cache.lookup("big") is None
+    cache.store("b", response(cache_control="max-age=60"), "projected", size=5000) #explicit size (streamed bodies) counts too
+    assert cache.lookup("b") is None
+
+def test_storing_a_url_again_replaces_its_bytes():
+    cache = ResponseCache()
+    cache.store(URL, response(body=b"x" * 100, cache_control="max-age=60"), 1)
+    cache.store(URL, response(body=b"x" * 40, cache_control="max-age=60"), 2)
+    assert cache.lookup(URL).data == 2
+    assert cache.stats()["bytes"] == 40 and cache.stats()["entries"] == 1
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(max_entries=0)
+    cache.store(URL, response(cache_control="max-age=60"), 1)
+    assert cache.lookup(URL) is None
@@ -0,0 +1,119 @@
+#Drives UpstreamScheduler directly (no HTTP), checks who gets sent when: token bucket, priorities, cancellation, failures
+import asyncio
+import os
+import sys
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE)) #nws_scheduler.py
+
+from nws_scheduler import PRIORITY_ALERTS, PRIORITY_BACKGROUND, PRIORITY_FORECAST, UpstreamScheduler, parse_retry_after
+
+async def drain(scheduler: UpstreamScheduler) -> None:
+    """Spends the saved-up burst so the next acquire() has to wait for a refill"""
+    for _ in range(scheduler.burst):
+        await scheduler.acquire()
+
+def test_bucket_refills_at_rate():
+    async def main():
+        scheduler = UpstreamScheduler(rate=50, burst=5)
+        start = time.monotonic()
+        for _ in range(15): #5 from the burst, 10 more at 50/s
+            await scheduler.acquire()
+        return time.monotonic() - start
+
+    assert 0.15 < asyncio.run(main()) < 1.0
+
+def test_priority_order_under_an_empty_bucket():
+    async def main():
+        scheduler = UpstreamScheduler(rate=20, burst=1)
+        await drain(scheduler)
+        order = []
+
+        async def request(name: str, priority: int):
+            await scheduler.acquire(priority)
+            order.append(name)
+
+        #all queued while the bucket is empty, so they're served by priority, then arrival
+        await asyncio.gather(
+            request("background", PRIORITY_BACKGROUND),
+            request("forecast 1", PRIORITY_FORECAST),
+            request("alerts", PRIORITY_ALERTS),
+            request("forecast 2", PRIORITY_FORECAST),
+        )
+        return order
+
+    assert asyncio.run(main()) == ["alerts", "forecast 1", "forecast 2", "background"]
+
+def test_cancelled_waiter_is_skipped():
+    async def main():
+        scheduler = UpstreamScheduler(rate=20, burst=1)
+        await drain(scheduler)
+        first = asyncio.create_task(scheduler.acquire(PRIORITY_ALERTS))
+        second = asyncio.create_task(scheduler.acquire(PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.wait_for(second, timeout=1) #gets the token the cancelled one would have had
+        assert first.cancelled()
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert stats["queue_depth"] == 0
+    assert stats["requests"] == 2 #the drain and the second waiter, not the cancelled one
+
+def test_crashed_dispatcher_fails_waiters_and_recovers():
+    async def main():
+        scheduler = UpstreamScheduler(rate=20, burst=1)
+
+        async def crash():
+            raise ValueError("boom")
+
+        scheduler._hand_out_tokens = crash
+        with pytest.raises(ValueError):
+            await asyncio.wait_for(scheduler.acquire(), timeout=1) #fails instead of hanging
+        del scheduler._hand_out_tokens #back to the real one, the next acquire starts a fresh dispatcher
+        await asyncio.wait_for(scheduler.acquire(), timeout=1)
+
+    asyncio.run(main())
+
+@pytest.mark.parametrize("rate", [0, -1])
+def test_no_rate_limit_does_not_stall(rate):
+    async def main():
+        scheduler = UpstreamScheduler(rate=rate, burst=1)
+        scheduler.on_throttled(None) #no division by a zero rate
+        scheduler.on_success()
+        await asyncio.wait_for(asyncio.gather(*(scheduler.acquire() for _ in range(100))), timeout=1)
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.rate == rate
+    assert scheduler.requests == 100
+
+def test_throttling_halves_the_rate_and_pauses_everyone():
+    async def main():
+        scheduler = UpstreamScheduler(rate=100, burst=10)
+        scheduler.on_throttled(0.2)
+        assert scheduler.rate == 50
+        start = time.monotonic()
+        await asyncio.gather(scheduler.acquire(), scheduler.acquire())
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) >= 0.19
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("1.5") == 1.5
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("soon") is None
+
+def test_parse_retry_after_http_date():
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True) #e.g. "Sat, 17 Oct 2026 12:00:30 GMT"
+    assert 28 <= parse_retry_after(later) <= 30
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=30), usegmt=True)
+    assert parse_retry_after(earlier) == 0.0
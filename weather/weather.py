@@ -20,38 +20,303 @@
 
 #COMM FLOW: User input -> host & llm processing -> client request -> server execution -> server response -> client to host/llm -> llm makes response -> user display to user
 
+import os # Reads environment variables so the connection pool can be tuned without editing code
+import json # serializes trace spans for the weather://traces resource
+import asyncio # for the background tasks that load/refresh the gridpoint index
+import time
+import argparse # reads the --transport/--host/--port command line flags
+import logging # reports background task failures (nobody awaits those, so their errors would vanish otherwise)
+from contextlib import nullcontext # do-nothing context manager, stands in for the tool call semaphore when there's no cap
+from contextlib import asynccontextmanager # Turns the lifespan generator below into an async context manager FastMCP can enter/exit
+from collections.abc import AsyncIterator
 from typing import Any # Lets you make a var or function of any type
 import httpx # Third-party python library which makes HTTP reqs
+from pydantic import BaseModel # comes with the mcp SDK, used to describe structured tool arguments
+from starlette.requests import Request # starlette is the web framework FastMCP's HTTP transports are built on (also comes with the mcp SDK)
+from starlette.responses import JSONResponse, PlainTextResponse
+from mcp.types import ToolAnnotations # hints about a tool's behaviour that clients can act on (e.g. mcp-client reuses read-only results)
 from mcp.server.fastmcp import FastMCP # mcp is a package from the MCP SDK, gets the server subpackage, and imports FastMap class from the  SDK 
-# define FastMCP server
-mcp = FastMCP("weather") #passing name of mcp server (so client called claude will use "weather" as key to launch the server)
-##automatically generates "structured tool definition," which is an MCP concept represented in JSON schema-like format
+from nws_cache import ResponseCache # our own in-memory HTTP cache (nws_cache.py, next to this file)
+from grid_index import GridPoint, GridPointIndex # persistent lat/lon -> forecast grid cell lookup (grid_index.py)
+from nws_alerts import AlertProjection, normalize_severities # streaming, projected parsing of big alert payloads (nws_alerts.py)
+from nws_scheduler import PRIORITY_ALERTS, PRIORITY_BACKGROUND, PRIORITY_FORECAST, RETRYABLE_STATUS, UpstreamScheduler, parse_retry_after # rate limiting + retries (nws_scheduler.py)
+from telemetry import Telemetry, parse_traceparent # timing spans + metrics (../telemetry/telemetry.py, shared with the client)
 
 # constants (all caps)
-NWS_API_BASE = "https://api.weather.gov" # this is the base url for the nws api, which will let us append different apths to get full api endpoint urls. For Sage, switch api to rest/excel one?
+NWS_API_BASE = os.environ.get("NWS_API_BASE", "https://api.weather.gov") # this is the base url for the nws api, which will let us append different apths to get full api endpoint urls. For Sage, switch api to rest/excel one?
+##can be overridden with the NWS_API_BASE env var, e.g. to point the server at a local stub for benchmarks
 USER_AGENT = "weather-app/1.0" # header which identifies the client making the server request, lets api providers know what applctns accessing services/enforce rate limits
 # note that requests coming from server are part of version 1.0 of the weather application
 
+# Connection pool settings (all overridable with env vars of the same name)
+NWS_MAX_CONNECTIONS = int(os.environ.get("NWS_MAX_CONNECTIONS", "20")) # max open sockets to the NWS api at once
+NWS_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("NWS_MAX_KEEPALIVE_CONNECTIONS", "10")) # how many idle sockets we keep around for reuse
+NWS_KEEPALIVE_EXPIRY = float(os.environ.get("NWS_KEEPALIVE_EXPIRY", "60")) # seconds an idle socket stays in the pool before it's closed
+NWS_CONNECT_TIMEOUT = float(os.environ.get("NWS_CONNECT_TIMEOUT", "5")) # seconds to open a TCP + TLS connection
+NWS_READ_TIMEOUT = float(os.environ.get("NWS_READ_TIMEOUT", "30")) # seconds to wait for response bytes (same 30s the old per-call timeout used)
+NWS_POOL_TIMEOUT = float(os.environ.get("NWS_POOL_TIMEOUT", "10")) # seconds to wait for a free connection when the pool is maxed out
+NWS_HTTP2 = os.environ.get("NWS_HTTP2", "1").lower() not in ("0", "false", "no") # multiplex requests over one connection when the h2 package is installed
+
+try:
+    import h2  # noqa: F401  # httpx only speaks HTTP/2 when the optional h2 package (httpx[http2]) is installed
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Response cache settings - setting either to 0 turns the cache off
+NWS_CACHE_MAX_ENTRIES = int(os.environ.get("NWS_CACHE_MAX_ENTRIES", "512")) # how many distinct urls we remember
+NWS_CACHE_MAX_BYTES = int(os.environ.get("NWS_CACHE_MAX_BYTES", str(32 * 1024 * 1024))) # total raw body size we keep in memory
+response_cache = ResponseCache(NWS_CACHE_MAX_ENTRIES, NWS_CACHE_MAX_BYTES) # shared by every tool call, least recently used urls are evicted first
+
+# Upstream traffic control - keeps us under NWS's rate limit and retries 429/5xx/network errors instead of failing the tool call
+NWS_RATE_LIMIT = float(os.environ.get("NWS_RATE_LIMIT", "10")) # max requests per second to NWS (cut in half on every 429, recovers on success), 0 = no limit
+NWS_RATE_BURST = int(os.environ.get("NWS_RATE_BURST", "10")) # requests that can go out back-to-back after a quiet period
+NWS_MAX_RETRIES = int(os.environ.get("NWS_MAX_RETRIES", "3")) # extra attempts after the first one fails
+NWS_RETRY_BASE_DELAY = float(os.environ.get("NWS_RETRY_BASE_DELAY", "0.5")) # seconds, doubled every attempt (with random jitter)
+NWS_RETRY_MAX_DELAY = float(os.environ.get("NWS_RETRY_MAX_DELAY", "30")) # longest we'll wait between attempts, even if Retry-After says more
+upstream = UpstreamScheduler(NWS_RATE_LIMIT, NWS_RATE_BURST, retry_base_delay=NWS_RETRY_BASE_DELAY, retry_max_delay=NWS_RETRY_MAX_DELAY)
+
+# Telemetry - a span per tool call, per make_nws_request and per HTTP attempt, plus counters (see ../telemetry/telemetry.py)
+##metrics are served at /metrics (HTTP mode) and as the weather://metrics resource, spans of one query at weather://traces/{trace_id}
+WEATHER_OTLP_FILE = os.environ.get("WEATHER_OTLP_FILE", "") # also append finished spans to this file as OTLP/JSON lines ("" = memory only)
+telemetry = Telemetry("weather", WEATHER_OTLP_FILE)
+
+# Gridpoint index settings - set NWS_GRID_INDEX_PATH to an empty string to keep the index in memory only
+NWS_GRID_INDEX_PATH = os.environ.get("NWS_GRID_INDEX_PATH", os.path.join(os.path.expanduser("~"), ".cache", "weather-mcp", "grid_index.sqlite3"))
+NWS_GRID_INDEX_PRECISION = int(os.environ.get("NWS_GRID_INDEX_PRECISION", "2")) # decimals lat/lon are rounded to before lookup
+NWS_GRID_INDEX_MAX_AGE = float(os.environ.get("NWS_GRID_INDEX_MAX_AGE", str(7 * 24 * 3600))) # seconds before an entry is re-checked against /points
+grid_index = GridPointIndex(NWS_GRID_INDEX_PATH, NWS_GRID_INDEX_PRECISION, NWS_GRID_INDEX_MAX_AGE)
+_background_tasks: set[asyncio.Task] = set() # holds references so fire-and-forget tasks aren't garbage collected mid-run
+
+def run_in_background(coro) -> None:
+    """Start a coroutine without waiting for it (used for index loading/refreshing)."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(_log_background_failure)
+
+def _log_background_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logging.getLogger(__name__).error("Background task failed", exc_info=task.exception())
+
+# One long-lived client for the whole process. Before, every make_nws_request built its own AsyncClient,
+# so every tool call paid a fresh DNS lookup + TCP handshake + TLS handshake (get_forecast paid it twice)
+##The pool keeps sockets open between calls so later requests skip all of that
+_http_client: httpx.AsyncClient | None = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared NWS client, creating it on first use (or after it has been closed)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=NWS_HTTP2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=NWS_MAX_CONNECTIONS,
+                max_keepalive_connections=NWS_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=NWS_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=NWS_CONNECT_TIMEOUT,
+                read=NWS_READ_TIMEOUT,
+                write=NWS_READ_TIMEOUT,
+                pool=NWS_POOL_TIMEOUT,
+            ),
+            headers={
+                "User-Agent": USER_AGENT, #user agent header, identifies application
+                "Accept": "application/geo+json" #Tells server what content types our client/application will accept (prefer GeoJSON format)
+            },
+        )
+    return _http_client
+
+async def close_http_client() -> None:
+    """Close the shared NWS client and every pooled connection it holds."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+# Shared resources (connection pool, gridpoint index) are reference counted:
+##over stdio there's one session per process, but over HTTP FastMCP enters the lifespan once PER SESSION,
+##so the first user opens them, the last one closes them, and sessions in between share the same warm pool and cache
+_resource_users = 0
+active_sessions = 0 # MCP sessions currently connected to this process
+
+@asynccontextmanager
+async def shared_resources() -> AsyncIterator[None]:
+    """Open the pool and gridpoint index for the first user, close them when the last user leaves."""
+    global _resource_users
+    if _resource_users == 0:
+        get_http_client()
+        run_in_background(grid_index.load()) #reads the saved gridpoints off disk without holding up startup
+    _resource_users += 1
+    try:
+        yield
+    finally:
+        _resource_users -= 1
+        if _resource_users == 0:
+            for task in list(_background_tasks):
+                task.cancel()
+            await close_http_client()
+            grid_index.close()
+
+@asynccontextmanager
+async def nws_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Open the connection pool when the server starts and close it cleanly on shutdown."""
+    global active_sessions
+    async with shared_resources():
+        active_sessions += 1
+        try:
+            yield
+        finally:
+            active_sessions -= 1
+
+# Server-wide limits (mostly matter in HTTP mode, where one process serves many clients)
+WEATHER_MAX_SESSIONS = int(os.environ.get("WEATHER_MAX_SESSIONS", "500")) # new HTTP sessions get a 503 past this many (0 = no limit)
+WEATHER_SESSION_IDLE_TIMEOUT = float(os.environ.get("WEATHER_SESSION_IDLE_TIMEOUT", "1800")) # seconds before a streamable HTTP session nobody uses is closed (0 = never)
+##clients that crash or drop off the network never send the DELETE that ends their session, without this they'd hold a slot forever
+WEATHER_MAX_INFLIGHT_TOOL_CALLS = int(os.environ.get("WEATHER_MAX_INFLIGHT_TOOL_CALLS", "100")) # tool calls past this many wait their turn (0 = no limit)
+
+class WeatherMCP(FastMCP):
+    """FastMCP that caps how many tool calls run at the same time across every session."""
+
+    def __init__(self, *args, max_inflight_tool_calls: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tool_call_slots = asyncio.Semaphore(max_inflight_tool_calls) if max_inflight_tool_calls > 0 else None
+        self.inflight_tool_calls = 0
+
+    async def call_tool(self, name: str, arguments: dict[str, Any]):
+        #every tools/call request from any client goes through here, tools calling each other directly (get_forecasts -> get_forecast) don't
+        #the span's parent is the client's tool call span when the client sent a traceparent, so both sides share one trace
+        with telemetry.span(f"tools/call {name}", parse_traceparent(self._request_traceparent()), tool=name) as span:
+            queued = time.perf_counter()
+            async with self.tool_call_slots or nullcontext():
+                span.set(slot_wait_ms=round((time.perf_counter() - queued) * 1000, 3))
+                self.inflight_tool_calls += 1
+                try:
+                    result = await super().call_tool(name, arguments)
+                except Exception:
+                    telemetry.count("weather_tool_calls_total", tool=name, status="error")
+                    raise
+                finally:
+                    self.inflight_tool_calls -= 1
+        telemetry.count("weather_tool_calls_total", tool=name, status="ok")
+        return result
+
+    def _request_traceparent(self) -> str | None:
+        #the client puts its W3C traceparent in the request's _meta (see call_tool in mcp-client/server_manager.py)
+        try:
+            meta = self._mcp_server.request_context.meta
+        except LookupError: #not inside an MCP request
+            return None
+        return getattr(meta, "traceparent", None) if meta is not None else None
+
+READ_ONLY = ToolAnnotations(readOnlyHint=True, openWorldHint=True) # every tool here only reads public NWS data, calling one twice changes nothing
+
+# define FastMCP server
+mcp = WeatherMCP("weather", lifespan=nws_lifespan, max_inflight_tool_calls=WEATHER_MAX_INFLIGHT_TOOL_CALLS) #passing name of mcp server (so client called claude will use "weather" as key to launch the server)
+##automatically generates "structured tool definition," which is an MCP concept represented in JSON schema-like format
+##lifespan ties the shared connection pool (and the gridpoint index) to the server's start/stop
+
+# Alert output settings
+NWS_ALERT_MAX_CHARS = int(os.environ.get("NWS_ALERT_MAX_CHARS", "1500")) # alert descriptions/instructions longer than this get cut off (0 = never cut)
+NWS_ALERT_STREAM_MIN_BYTES = int(os.environ.get("NWS_ALERT_STREAM_MIN_BYTES", str(1024 * 1024))) # alert bodies this big are parsed as they stream in
+##(flat memory, ~3x the CPU of json.loads), smaller ones are read whole and parsed with json.loads - see nws_alerts.py
+NWS_ALERTS_PAGE_SIZE = int(os.environ.get("NWS_ALERTS_PAGE_SIZE", "10")) # alerts per get_alerts call unless the llm asks for a different limit
+
+# Batch tool settings
+NWS_BATCH_CONCURRENCY = int(os.environ.get("NWS_BATCH_CONCURRENCY", "8")) # max items a batch tool works on at the same time
+
+# Requests currently on the wire, keyed by url ("single-flight")
+##if 10 tool calls ask for the same url at once, the first one fetches and the other 9 wait on that same task
+_inflight_requests: dict[str, asyncio.Task] = {}
+
 # Helper function for getting/formatting National Weather Service API data
-async def make_nws_request(url: str) -> dict[str, Any] | None:
+async def make_nws_request(url: str, priority: int = PRIORITY_FORECAST, projection: AlertProjection | None = None) -> dict[str, Any] | None:
     #""""function is expected to return a dictionary (keys are string, values are of any type) OR None - common for JSON responses"""
-    # Making headers dictionary of HTTPs
-    headers = {
-        "User-Agent": USER_AGENT, #user agent header, identifies application
-        "Accept": "application/geo+json" #Tells server what content types our client/application will accept (prefer GeoJSON format)  //which format will we accept from excel app?
-    }
-    async with httpx.AsyncClient() as client: #making client instance instead of httpx.get, better practice for multiple requests. (NOTE: check out 'asynch with') prob good practice for this too
+    #priority decides who goes first when requests have to queue for the rate limiter (PRIORITY_ALERTS < PRIORITY_FORECAST < PRIORITY_BACKGROUND)
+    #projection (alerts only) streams the body through an incremental parser that keeps just the fields we render, see nws_alerts.py
+    ##projected results get their own cache/single-flight key, since the same url can be projected with different filters
+    key = url if projection is None else f"{url}#{projection.cache_tag}"
+    endpoint = nws_endpoint(url)
+    with telemetry.span(f"nws.request {endpoint}", path=url.removeprefix(NWS_API_BASE), priority=priority) as span:
+        #Check the response cache first - a fresh entry means NWS already told us this data is still good, so skip the network
+        cached = response_cache.lookup(key)
+        if cached is not None and cached.is_fresh():
+            response_cache.hits += 1
+            span.set(cache="hit")
+            telemetry.count("weather_nws_requests_total", endpoint=endpoint, cache="hit")
+            return cached.data
+
+        task = _inflight_requests.get(key)
+        span.set(cache="coalesced" if task is not None else "fetch") #coalesced = waited on a fetch another call had already started
+        telemetry.count("weather_nws_requests_total", endpoint=endpoint, cache="coalesced" if task is not None else "fetch")
+        if task is None: #nobody is fetching this url yet, so we start the fetch and let later callers share it
+            task = asyncio.create_task(_fetch_nws(url, key, cached, priority, projection)) #the task inherits this span, so its HTTP spans nest under it
+            _inflight_requests[key] = task
+            task.add_done_callback(lambda _: _inflight_requests.pop(key, None))
+        data = await asyncio.shield(task) #shield: one caller being cancelled shouldn't cancel the fetch everyone else is waiting on
+        span.set(ok=data is not None)
+        return data
+
+def nws_endpoint(url: str) -> str:
+    """First path segment of an NWS url ("points", "gridpoints", "alerts"), used as a low-cardinality metric label."""
+    return url.removeprefix(NWS_API_BASE).lstrip("/").split("/", 1)[0] or "other"
+
+async def _fetch_nws(url: str, key: str, cached, priority: int, projection: AlertProjection | None) -> dict[str, Any] | None:
+    #the network half of make_nws_request, only ever run once per key at a time
+    client = get_http_client() #reuses the pooled client (headers + timeouts are set on it once) instead of making a new one per call
+    endpoint = nws_endpoint(url)
+    for attempt in range(NWS_MAX_RETRIES + 1): #every request here is a GET, so it's always safe to try again
+        retry_after = None
         try:
-            response = await client.get(url, headers = headers, timeout=30.0) #pause execution of current function until client.get() is complete 
-            #Note: other tasks can be run in the meantime, keeping server responsive
-            #Tells httpx to send an HTTP GET request to this url
-            #Passes in headers dictionary to include user-agent and accept preferences
-            #Times out if nws api takes more than 30s
-            response.raise_for_status() #if there's an error, this will raise an httpstatuserror exception
-            return response.json() #if above was successful, executes!
+            with telemetry.span(f"nws.http {endpoint}", attempt=attempt) as span:
+                queued = time.perf_counter()
+                await upstream.acquire(priority) #waits for the rate limiter (and any Retry-After pause) before touching the network
+                span.set(queue_ms=round((time.perf_counter() - queued) * 1000, 3))
+                request = client.build_request("GET", url, headers=response_cache.conditional_headers(cached))
+                response = await client.send(request, stream=projection is not None) #pause execution of current function until the response headers are in
+                #Note: other tasks can be run in the meantime, keeping server responsive
+                #Tells httpx to send an HTTP GET request to this url, over a kept-alive connection when one is free
+                #If we have a stale copy, sends its ETag/Last-Modified so NWS can reply 304 Not Modified instead of the whole body
+                #Times out per phase (connect/read/pool) based on the settings above
+                #stream=True (projected requests) leaves the body on the socket so we can parse it as it arrives instead of buffering it all
+                span.set(status=response.status_code, http_version=response.http_version)
+                try:
+                    if response.status_code in RETRYABLE_STATUS: #throttled or NWS having a bad moment - worth another try
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        if response.status_code == 429:
+                            upstream.on_throttled(retry_after) #slow everyone down, not just this request
+                        elif retry_after:
+                            upstream.pause(retry_after)
+                        raise httpx.HTTPStatusError(f"NWS returned {response.status_code}", request=response.request, response=response)
+                    upstream.on_success()
+                    if response.status_code == 304 and cached is not None:
+                        response_cache.revalidations += 1
+                        response_cache.refresh(key, cached, response)
+                        return cached.data #unchanged upstream, reuse the body we already parsed
+                    response.raise_for_status() #if there's an error, this will raise an httpstatuserror exception (404 etc. aren't retried)
+                    if projection is None:
+                        data, size = response.json(), None #if above was successful, executes! (size None = use the raw body length)
+                    else:
+                        data, size = await projection.parse(response.aiter_bytes()) #big bodies are parsed chunk by chunk and never held in memory whole
+                    response_cache.misses += 1
+                    response_cache.store(key, response, data, size) #only kept if Cache-Control/Expires/validators allow it
+                    return data
+                finally:
+                    await response.aclose() #hands the connection back to the pool (a no-op when the body was already read)
+                    span.set(bytes=response.num_bytes_downloaded)
+                    telemetry.count("weather_nws_http_requests_total", endpoint=endpoint, status=response.status_code)
+                    telemetry.count("weather_nws_response_bytes_total", response.num_bytes_downloaded, endpoint=endpoint)
+        except (httpx.TransportError, httpx.HTTPStatusError) as e: #network trouble (timeouts, dropped connections) or a retryable status
+            retryable = isinstance(e, httpx.TransportError) or e.response.status_code in RETRYABLE_STATUS
+            if not retryable or attempt == NWS_MAX_RETRIES:
+                return None
+            upstream.retries += 1
+            await asyncio.sleep(upstream.backoff_delay(attempt, retry_after)) #exponential backoff with jitter, so retries don't all land at once
         except Exception: #broad exception catch, for the actual implementation may be good to catch specific exceptions and handle them differently for debugging  (research diff exceptions to throw based on our application)
             return None #If there's any exception within the try block, jump execution here. the function returns none, so request didn't get valid date
             # None return value is checked by calling functions (get_alerts, get_forecast to see if they got data or need to return an error message)
+    return None
 
 #https://www.weather.gov/documentation/services-web-api#/default/alerts_query - Here's the link to the API, schema has the features being used here!
 ##application/geo+json - that's how they knew to do geo+json content under headers
@@ -73,36 +338,68 @@ Instructions: {props.get('instruction', 'No specific instructions provided')}
 #Is there a way to see where the API has missing/inconsistent information or go into the schema? Research later - maybe some sql stuff could be useful in case one of the features/parameters
 #have a lot of missing data - potential optimization?
 
-@mcp.tool() #when FastMCP server starts from mcp.run() call, goes throguh functions marked with this so FastMCP knows that get_alerts is a fctn to expose to mcp client connecting as a capability
+@mcp.tool(annotations=READ_ONLY) #when FastMCP server starts from mcp.run() call, goes throguh functions marked with this so FastMCP knows that get_alerts is a fctn to expose to mcp client connecting as a capability
 #FastMCP SDK uses function name, docstring, and type hints to make tool def/schema, no need to make my own json/yaml schemas for the tool. 
 ##RESEARCH LATER: how to format docstring properly - does the formatting improve effectiveness of mcp client, any key wording, or is it not important?
 ##understand async/await, network i/o, after this!
 
 #Note: async wait combo lets server handle multiple requests at the same time, no blocking, so more efficient and responsive
 ##make_nws_request is is an async function involving network I/O
-async def get_alerts(state:str) -> str:
-    """Get weather alerts for a state. 
+async def get_alerts(state: str, limit: int = NWS_ALERTS_PAGE_SIZE, cursor: int = 0, severity: list[str] | None = None) -> str:
+    """Get weather alerts for a state, a page at a time.
     Args:
         state: US State Code with two letters, like WA GA CA NY
+        limit: Max number of alerts to return in this page
+        cursor: Position to continue from - pass the cursor value given at the end of the previous page (0 starts from the top)
+        severity: Only return alerts with these severities, any of Extreme, Severe, Moderate, Minor, Unknown (default: all)
     """
     #API part it's referencing here: https://www.weather.gov/documentation/services-web-api#/default/alerts_active_area 
     url = f"{NWS_API_BASE}/alerts/active/area/{state}"
-    data = await make_nws_request(url) #http request to NWS api, pauses get_alerts execution, resumes once network request complete - NEED TO UNDERSTAND BETTER
+    severities = normalize_severities(severity)
+    projection = AlertProjection(severities, NWS_ALERT_MAX_CHARS, NWS_ALERT_STREAM_MIN_BYTES) #only the fields format_alert shows are kept, filtered + truncated
+    data = await make_nws_request(url, PRIORITY_ALERTS, projection) #http request to NWS api (jumps the queue ahead of forecasts), pauses get_alerts execution, resumes once network request complete - NEED TO UNDERSTAND BETTER
 
     if not data or "features" not in data: #error handling for API resp -if data is none, return none (network error, bad status code) #also handles if doesn't have fetures key
         return "Cannot get alerts, none found here!" #these messages are passed from mcp client to llm/claude, which incorporates it into the natural lang resp to user, so in the chat interface
-    if not data["features"]:
+    features = data["features"]
+    if not features:
+        if severities:
+            return f"No active {'/'.join(sorted(severities))} alerts for this state."
         return "No active alerts for this state."
-    
-    alerts = [format_alert(feature) for feature in data["features"]] #list comprehension, goes through each alert object dict within data["features"] list (list of alert dictionaries)
+
+    #Paging - a big state can have dozens of alerts, sending them all at once floods the llm's context
+    limit = max(1, limit)
+    cursor = max(0, cursor)
+    if cursor >= len(features):
+        return f"No more alerts, all {len(features)} have been shown."
+    page = features[cursor:cursor + limit]
+    alerts = [format_alert(feature) for feature in page] #list comprehension, goes through each alert object dict in this page of data["features"] (list of alert dictionaries)
     #for each feature, calls format_alert function to transform it into nice formatted string
-    return "\n---\n".join(alerts) #new line, three hypens, new line - makes separation btwn diff alerts when being read by llm/displayed to user
+    result = "\n---\n".join(alerts) #new line, three hypens, new line - makes separation btwn diff alerts when being read by llm/displayed to user
     ##combines individually formatted alert strings into one cohesive formatting string. final string w all formatted alerts is given to mcp client
+    next_cursor = cursor + len(page)
+    if next_cursor < len(features): #tell the llm how to get the rest instead of silently dropping them
+        result += f"\n---\nShowing alerts {cursor + 1}-{next_cursor} of {len(features)}. For more, call get_alerts again with cursor={next_cursor}"
+    return result
+
+#Asks NWS which forecast office/grid cell covers a lat/lon, and saves the answer in the gridpoint index
+#/points/{latitude},{longitude} from https://www.weather.gov/documentation/services-web-api#/ GET section
+##NWS only accepts up to 4 decimal places here (more gets a redirect), so we format the coordinates to 4
+async def lookup_gridpoint(latitude: float, longitude: float, priority: int = PRIORITY_FORECAST) -> GridPoint | None:
+    points_data = await make_nws_request(f"{NWS_API_BASE}/points/{latitude:.4f},{longitude:.4f}", priority)
+    #points api returns a single geojson feature, the grid info lives under properties
+    try:
+        props = points_data["properties"]
+        grid = GridPoint(props["gridId"], int(props["gridX"]), int(props["gridY"]), time.time())
+    except (TypeError, KeyError, ValueError): #None (request failed) or a response without grid info
+        return None
+    await grid_index.put(latitude, longitude, grid)
+    return grid
 
 #get_forecast is another tool provided by MCP server, main purpose is to get a request from mcp client (llm triggered) asking for weather forecast for a specific geographic location, 
 #identified by latitude and longitude. Gets forecast from NWS API by querying points enpoint (forecast grid metadata for that location including URL), uses that URL to get detailed forecast data
 #handles errors at all api interaction steps, puts forecast periods into readable strings, combines into one string to return to mcp client/llm
-@mcp.tool()
+@mcp.tool(annotations=READ_ONLY)
 async def get_forecast(latitude: float, longitude:float) -> str: #remember that given thsi info, fastmcp auto generates schema (name, description, param, return type) from fctn signature and docstring
     #^async performs network I/O, calling make_nws_request. add i/o notes to doc fs
     """Get a location's weather forecast
@@ -110,25 +407,29 @@ async def get_forecast(latitude: float, longitude:float) -> str: #remember that
         latitude: Location's latitude
         longitude: Location's longitude
     """
-    #1st NWS API call getting gridpoint information
-    #/points/{latitude},{longitude} from https://www.weather.gov/documentation/services-web-api#/ GET section
-    points_url = f"{NWS_API_BASE}/points/{latitude}, {longitude}"
-    points_data = await make_nws_request(points_url)
+    #1st step: which forecast grid cell covers this location?
+    #Checks the local gridpoint index first - on a hit we skip the /points round trip entirely
+    grid = grid_index.get(latitude, longitude)
+    from_index = grid is not None
+    telemetry.count("weather_grid_index_lookups_total", result="hit" if from_index else "miss")
+    if grid is None:
+        grid = await lookup_gridpoint(latitude, longitude) #cold lookup, asks /points and saves the answer
+    elif grid_index.is_stale(grid):
+        run_in_background(lookup_gridpoint(latitude, longitude, PRIORITY_BACKGROUND)) #use the saved cell now, re-check it with NWS for next time
 
     #remember to do error handling for each api call
-    if not points_data:
+    if grid is None:
         return "Cannot get forecast data for this location" #initial step of getting forecast data
-    #They didn't have a "features" not in data part here like they did for alerts
-    ##bc alerts returns a geojson featurecollection, which has top level key called "features" by default which has a list of individual alert features
-    ##nws api returns object with features key, but its value is an empty list even if no active alerts
-    ###therefore, important to check if features not in data - would be an unexpected response which doesn't include the expected geojson feaatures key
-    #on the other side, points api returns a single geojson feature directly
 
     #2nd NWS API call getting detailed forecast
-    forecast_url = points_data["properties"]["forecast"] #from the initial points url request where it alr has lat long, now it looks for properties and forecast
-    #I see properties in the schema, but not forecast - find where they got that from
     #https://api.weather.gov/gridpoints/FFC/80,50/forecast - can see properties in more detail here!
-    forecast_data = await make_nws_request(forecast_url) #pausing execution again for network request
+    forecast_data = await make_nws_request(grid.forecast_url(NWS_API_BASE)) #pausing execution again for network request
+    if not forecast_data and from_index:
+        #grid cells are occasionally re-drawn by NWS, so if a saved cell fails, ask /points again once
+        ##the saved cell is only replaced when /points answers (lookup_gridpoint -> put), so an NWS outage can't wipe the index
+        fresh = await lookup_gridpoint(latitude, longitude)
+        if fresh is not None and fresh.forecast_url(NWS_API_BASE) != grid.forecast_url(NWS_API_BASE): #same cell = same failing url, don't repeat it
+            forecast_data = await make_nws_request(fresh.forecast_url(NWS_API_BASE))
     if not forecast_data:
         return "Cannot get detailed forecast :("
     periods = forecast_data["properties"]["periods"]
@@ -146,8 +447,252 @@ async def get_forecast(latitude: float, longitude:float) -> str: #remember that
     
     return "\n---\n".join(formatted_periods_list) # Join the list of strings
 
+#Batch tools - agents often want many forecasts/alerts at once, and one MCP round trip per item run one after another is slow
+##both tools fan out at most NWS_BATCH_CONCURRENCY items at a time, only do each distinct item once,
+##and return results in the same order they were asked for with errors reported per item (one bad item doesn't sink the batch)
+async def run_batch(keys: list, fetch) -> list[str]:
+    unique_keys = list(dict.fromkeys(keys)) #drops duplicates but keeps first-seen order
+    semaphore = asyncio.Semaphore(max(1, NWS_BATCH_CONCURRENCY))
+
+    async def run_one(key) -> str:
+        async with semaphore: #waits here if NWS_BATCH_CONCURRENCY items are already running
+            try:
+                return await fetch(key)
+            except Exception as e:
+                return f"Error: {e}"
+
+    results = dict(zip(unique_keys, await asyncio.gather(*(run_one(key) for key in unique_keys))))
+    return [results[key] for key in keys]
+
+class Location(BaseModel): #pydantic model, FastMCP turns it into a JSON schema object with latitude/longitude fields
+    latitude: float
+    longitude: float
+
+@mcp.tool(annotations=READ_ONLY)
+async def get_forecasts(locations: list[Location]) -> str:
+    """Get weather forecasts for several locations in one call. Results are returned in the same order as the input.
+    Args:
+        locations: List of locations, each with a latitude and longitude
+    """
+    if not locations:
+        return "No locations given."
+    keys = [(location.latitude, location.longitude) for location in locations]
+    results = await run_batch(keys, lambda key: get_forecast(*key))
+    return "\n======\n".join(f"Forecast for {lat}, {lon}:\n{result}" for (lat, lon), result in zip(keys, results))
+
+@mcp.tool(annotations=READ_ONLY)
+async def get_alerts_multi(states: list[str], severity: list[str] | None = None) -> str:
+    """Get weather alerts for several states in one call. Results are returned in the same order as the input.
+    Args:
+        states: List of US State Codes with two letters, like WA GA CA NY
+        severity: Only return alerts with these severities, any of Extreme, Severe, Moderate, Minor, Unknown (default: all)
+    """
+    if not states:
+        return "No states given."
+    keys = [state.strip().upper() for state in states] #"ca" and "CA " are the same state, so they only get fetched once
+    results = await run_batch(keys, lambda state: get_alerts(state, severity=severity)) #first page of each state, use get_alerts with a cursor for the rest
+    return "\n======\n".join(f"Alerts for {state}:\n{result}" for state, result in zip(keys, results))
+
+#Resources are read-only data the client can fetch (see notes at the top) - this one lets us check how well the cache is doing
+@mcp.resource("weather://cache/stats")
+def get_cache_stats() -> dict[str, int]:
+    """Hit, miss and revalidation counters for the NWS response cache, plus its current size."""
+    return response_cache.stats()
+
+@mcp.resource("weather://upstream/stats")
+def get_upstream_stats() -> dict[str, float]:
+    """Rate limiter queue depth, wait times, current rate, 429s and retries for calls to the NWS api."""
+    return upstream.stats()
+
+@mcp.resource("weather://metrics", mime_type="text/plain")
+def get_metrics() -> str:
+    """Tool call, NWS request and cache counters plus latency histograms, in the Prometheus text format."""
+    return metrics_text()
+
+@mcp.resource("weather://traces/{trace_id}", mime_type="application/json")
+def get_trace(trace_id: str) -> str:
+    """This server's spans for one trace id (OTLP/JSON), so a client can show where a query's tool time went."""
+    return json.dumps(telemetry.otlp(telemetry.trace(trace_id)))
+
+def metrics_text() -> str:
+    gauges = {
+        "weather_active_sessions": active_sessions,
+        "weather_inflight_tool_calls": mcp.inflight_tool_calls,
+        "weather_upstream_queue_depth": upstream.stats()["queue_depth"],
+        "weather_upstream_rate": upstream.rate,
+        "weather_cache_entries": response_cache.stats()["entries"],
+        "weather_cache_bytes": response_cache.stats()["bytes"],
+    }
+    return telemetry.prometheus_text(gauges)
+
+#HTTP mode: one long-running process serves many clients over the network instead of every client spawning its own
+#server over stdio - so every client shares the same warm connection pool, response cache and gridpoint index
+@mcp.custom_route("/health", methods=["GET"])
+async def health(request: Request) -> JSONResponse:
+    return JSONResponse({
+        "status": "ok",
+        "active_sessions": active_sessions,
+        "inflight_tool_calls": mcp.inflight_tool_calls,
+        "cache": response_cache.stats(),
+        "upstream": upstream.stats(),
+    })
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(metrics_text(), media_type="text/plain; version=0.0.4") #what Prometheus scrapes
+
+class SessionLimitMiddleware:
+    """Turns away requests that would open a new MCP session once WEATHER_MAX_SESSIONS are connected,
+    and closes streamable HTTP sessions that have been idle for longer than idle_timeout seconds."""
+
+    def __init__(self, app, max_sessions: int, idle_timeout: float = 0):
+        self.app = app
+        self.max_sessions = max_sessions
+        self.opening = 0 # sessions whose first request is still being handled (may not be counted in active_sessions yet)
+        ##a session can be counted in both for a moment, so a burst of new sessions near the limit may be turned away a bit early - never let in past it
+        self.idle_timeout = idle_timeout
+        self.sessions: dict[str, list] = {} # streamable HTTP session id -> [last request time, requests still open]
+        self._reaper: asyncio.Task | None = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.idle_timeout > 0 and self._is_streamable_http(scope):
+            await self._track_session(scope, receive, send)
+            return
+        await self._limit_sessions(scope, receive, send)
+
+    async def _limit_sessions(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_sessions <= 0 or not self._opens_session(scope):
+            await self.app(scope, receive, send)
+            return
+        if active_sessions + self.opening >= self.max_sessions:
+            response = JSONResponse({"error": "Too many sessions, try again later"}, status_code=503, headers={"Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+        self.opening += 1
+        holding_slot = True
+
+        async def send_and_release(message):
+            #a redirect (/mcp -> /mcp/) or error response doesn't open a session, so give the slot back right away
+            nonlocal holding_slot
+            if message["type"] == "http.response.start" and message["status"] >= 300 and holding_slot:
+                holding_slot = False
+                self.opening -= 1
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            if holding_slot:
+                self.opening -= 1
+
+    def _opens_session(self, scope) -> bool:
+        #streamable HTTP: a POST without an mcp-session-id header is a new session's initialize request
+        #SSE: every GET on the sse path opens a new session
+        path, method = scope["path"], scope["method"]
+        if self._is_streamable_http(scope):
+            return method == "POST" and _session_id(scope["headers"]) is None
+        return method == "GET" and path == mcp.settings.sse_path
+
+    def _is_streamable_http(self, scope) -> bool:
+        return scope["path"].rstrip("/") == mcp.settings.streamable_http_path.rstrip("/")
+
+    async def _track_session(self, scope, receive, send):
+        #notes when each session was last used and how many of its requests are still open (a GET event stream stays
+        #open as long as the client is listening), so only sessions with nothing open and no recent requests expire
+        session_id = _session_id(scope["headers"])
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._expire_idle_sessions())
+
+        async def send_and_learn_id(message):
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                if session_id is None and message["status"] < 300: #a new session's id comes back on its initialize response
+                    session_id = _session_id(message.get("headers", []))
+                    if session_id is not None:
+                        self.sessions[session_id] = [time.monotonic(), 1]
+                elif message["status"] == 404: #the SDK no longer knows this session
+                    self.sessions.pop(session_id, None)
+            await send(message)
+
+        entry = self.sessions.get(session_id) if session_id is not None else None
+        if entry is not None:
+            entry[0] = time.monotonic()
+            entry[1] += 1
+        try:
+            await self._limit_sessions(scope, receive, send_and_learn_id)
+        finally:
+            entry = self.sessions.get(session_id) if session_id is not None else None
+            if entry is not None:
+                entry[0] = time.monotonic()
+                entry[1] -= 1
+            if scope["method"] == "DELETE": #the client ended its session itself
+                self.sessions.pop(session_id, None)
+
+    async def _expire_idle_sessions(self) -> None:
+        while True:
+            await asyncio.sleep(min(60.0, self.idle_timeout / 4))
+            cutoff = time.monotonic() - self.idle_timeout
+            for session_id, (last_seen, open_requests) in list(self.sessions.items()):
+                if open_requests == 0 and last_seen < cutoff:
+                    await self._close_session(session_id)
+
+    async def _close_session(self, session_id: str) -> None:
+        #ends the session exactly like a client's DELETE would: the SDK closes its streams, the session's lifespan exits
+        #(active_sessions goes down) and later requests with this id get 404, telling the client to start a new session
+        ##mcp 1.10 has no public way to expire a session, so the server sends the DELETE to itself
+        self.sessions.pop(session_id, None)
+        path = mcp.settings.streamable_http_path.rstrip("/") + "/" #FastMCP mounts the app here, "/mcp" would just get a redirect
+        status = None
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "DELETE", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+            "headers": [(b"host", f"{mcp.settings.host}:{mcp.settings.port}".encode()), (b"mcp-session-id", session_id.encode())],
+            "client": ("127.0.0.1", 0), "server": (mcp.settings.host, mcp.settings.port),
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            logging.getLogger(__name__).exception("Could not close idle session %s", session_id)
+            return
+        if status != 200:
+            logging.getLogger(__name__).warning("Could not close idle session %s (HTTP %s)", session_id, status)
+            return
+        getattr(mcp.session_manager, "_server_instances", {}).pop(session_id, None) #the SDK keeps terminated transports around otherwise
+
+def _session_id(headers) -> str | None:
+    return next((value.decode() for name, value in headers if name.lower() == b"mcp-session-id"), None)
+
+async def run_http(transport: str) -> None:
+    """Serve over streamable HTTP (or SSE) with uvicorn, keeping shared resources open for the whole process."""
+    import uvicorn
+    app = mcp.streamable_http_app() if transport == "streamable-http" else mcp.sse_app()
+    idle_timeout = WEATHER_SESSION_IDLE_TIMEOUT if transport == "streamable-http" else 0 #an SSE session ends when its stream closes
+    config = uvicorn.Config(SessionLimitMiddleware(app, WEATHER_MAX_SESSIONS, idle_timeout), host=mcp.settings.host, port=mcp.settings.port, log_level=mcp.settings.log_level.lower())
+    async with shared_resources(): #held by the process itself, so the pool stays warm even when no session is connected
+        await uvicorn.Server(config).serve()
+
 #Coded
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NWS weather MCP server")
+    parser.add_argument("--transport", choices=["stdio", "streamable-http", "sse"], default=os.environ.get("WEATHER_TRANSPORT", "stdio"),
+                        help="stdio (default, one client per process) or an HTTP transport (many clients per process)")
+    parser.add_argument("--host", default=mcp.settings.host, help="HTTP bind address (also FASTMCP_HOST)")
+    parser.add_argument("--port", type=int, default=mcp.settings.port, help="HTTP port (also FASTMCP_PORT)")
+    args = parser.parse_args()
+    mcp.settings.host, mcp.settings.port = args.host, args.port
+
     # Initialize and run the server
-    mcp.run(transport='stdio')
\ No newline at end of file
+    if args.transport == "stdio":
+        mcp.run(transport='stdio')
+    else:
+        asyncio.run(run_http(args.transport))
\ No newline at end of file